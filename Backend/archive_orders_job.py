@@ -0,0 +1,74 @@
+# archive_orders_job.py (Moves old orders from the hot collection to the archive tier)
+
+import os
+import time
+import argparse
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+from common.mongo import create_client
+
+load_dotenv()
+
+MONGO_URI = os.environ.get('ORDER_DB_URI')
+ORDER_ARCHIVE_HORIZON_DAYS = int(os.environ.get('ORDER_ARCHIVE_HORIZON_DAYS', 365))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.environ.get('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+DUPLICATE_KEY_ERROR = 11000
+
+if not MONGO_URI:
+    raise RuntimeError("ORDER_DB_URI not found in .env file")
+
+db = create_client(MONGO_URI).order_db
+orders_collection = db.orders
+archived_orders_collection = db.orders_archive
+order_meta_collection = db.order_meta
+
+
+def ensure_archive_indexes():
+    # The archive serves per-user history, date-ranged reports and lifetime
+    # seller stats, so of the multikey item indexes it keeps only items.owner_id.
+    archived_orders_collection.create_index('order_id', unique=True)
+    archived_orders_collection.create_index([('user_id', ASCENDING), ('created_at', DESCENDING)])
+    archived_orders_collection.create_index([('created_at', DESCENDING)])
+    archived_orders_collection.create_index('items.owner_id')
+
+
+def archive_orders(horizon_days=ORDER_ARCHIVE_HORIZON_DAYS, batch_size=ORDER_ARCHIVE_BATCH_SIZE):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=horizon_days)
+
+    # Publish the new cutoff before moving anything, so readers start
+    # consulting the archive for this range before orders disappear from the hot tier.
+    order_meta_collection.update_one({'_id': 'archive'}, {'$max': {'cutoff': cutoff}}, upsert=True)
+
+    moved = 0
+    while True:
+        batch = list(orders_collection.find({'created_at': {'$lt': cutoff}}).sort('created_at', ASCENDING).limit(batch_size))
+        if not batch:
+            break
+        try:
+            archived_orders_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Orders copied by an interrupted earlier run are already archived.
+            if any(err.get('code') != DUPLICATE_KEY_ERROR for err in e.details.get('writeErrors', [])):
+                raise
+        orders_collection.delete_many({'_id': {'$in': [order['_id'] for order in batch]}})
+        moved += len(batch)
+
+    print(f"Archived {moved} orders older than {cutoff:%Y-%m-%d}.")
+    return moved
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move orders older than the horizon to the archive tier.")
+    parser.add_argument('--interval', type=int, default=0,
+                        help="Re-run every N seconds instead of exiting after one run.")
+    args = parser.parse_args()
+
+    ensure_archive_indexes()
+    while True:
+        archive_orders()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,94 @@
+# bench_json_provider.py (CPU per response and bytes on the wire for the JSON providers)
+#
+# Usage: python benchmarks/bench_json_provider.py --orders 2000 --products 5000
+#
+# Builds responses shaped like /admin/orders (orders with items and a
+# created_at datetime) and /products, then times Flask's default provider
+# against FastJSONProvider, and gzip/brotli on top of the encoded body.
+# CPU time is process time, so the numbers don't depend on machine load.
+
+import os
+import sys
+import gzip
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.json_provider import FastJSONProvider, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY, brotli, orjson
+
+
+def make_orders(count):
+    started = datetime(2025, 1, 1)
+    return [{
+        "order_id": f"{i:08x}-0000-4000-8000-000000000000",
+        "user_id": f"user{i % 500}",
+        "items": [{
+            "product_id": f"P{(i + j) % 997:04x}",
+            "name": f"Product {(i + j) % 997}",
+            "quantity": random.randint(1, 3),
+            "price_per_item": round(random.uniform(5, 500), 2),
+            "owner_id": f"seller{(i + j) % 40}",
+        } for j in range(random.randint(1, 5))],
+        "total_price": round(random.uniform(5, 1500), 2),
+        "transaction_id": f"txn_{i:032x}",
+        "status": "completed",
+        "created_at": started + timedelta(minutes=i),
+    } for i in range(count)]
+
+
+def make_products(count):
+    return [{
+        "id": f"P{i:04x}",
+        "name": f"Product {i}",
+        "description": "A perfectly ordinary product description of moderate length. " * 2,
+        "price": round(random.uniform(5, 500), 2),
+        "owner_id": f"seller{i % 40}",
+    } for i in range(count)]
+
+
+def cpu_ms(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        result = fn()
+    return (time.process_time() - started) * 1000 / repeat, result
+
+
+def run(app, name, payload, repeat):
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+    with app.app_context():
+        default_ms, default_body = cpu_ms(lambda: default_provider.response(payload).get_data(), repeat)
+        fast_ms, fast_body = cpu_ms(lambda: fast_provider.response(payload).get_data(), repeat)
+        gzip_ms, gzip_body = cpu_ms(lambda: gzip.compress(fast_body, compresslevel=COMPRESS_GZIP_LEVEL), repeat)
+        rows = [
+            ("flask default", default_ms, len(default_body)),
+            ("orjson" if orjson else "stdlib fallback", fast_ms, len(fast_body)),
+            (f"  + gzip {COMPRESS_GZIP_LEVEL}", fast_ms + gzip_ms, len(gzip_body)),
+        ]
+        if brotli is not None:
+            brotli_ms, brotli_body = cpu_ms(lambda: brotli.compress(fast_body, quality=COMPRESS_BROTLI_QUALITY), repeat)
+            rows.append((f"  + brotli {COMPRESS_BROTLI_QUALITY}", fast_ms + brotli_ms, len(brotli_body)))
+
+    print(f"\n{name}")
+    print(f"{'encoder':<20} {'CPU ms/resp':>12} {'bytes':>12} {'saved':>8}")
+    for label, ms, size in rows:
+        print(f"{label:<20} {ms:>12.2f} {size:>12} {1 - size / len(default_body):>8.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    app = Flask(__name__)
+    run(app, f"/admin/orders ({args.orders} orders)", make_orders(args.orders), args.repeat)
+    run(app, f"/products ({args.products} products)", make_products(args.products), args.repeat)
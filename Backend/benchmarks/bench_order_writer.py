@@ -0,0 +1,66 @@
+# bench_order_writer.py (Orders/sec of the group-commit order writer at different batch windows)
+#
+# Usage: python benchmarks/bench_order_writer.py [--threads 64] [--orders 5000] [--windows 0 1 2 5 10]
+# Writes into a scratch `order_bench` database on ORDER_DB_URI and drops it afterwards.
+
+import os
+import sys
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.write_concern import WriteConcern
+from order_services import OrderWriter, client
+
+
+def make_order(i):
+    return {
+        "order_id": str(uuid.uuid4()),
+        "user_id": f"bench_user_{i % 500}",
+        "items": [{"product_id": f"P{i % 50:03d}", "name": "Bench item", "quantity": 1, "price_per_item": 9.99, "owner_id": "bench_seller"}],
+        "total_price": 9.99,
+        "transaction_id": f"txn_{uuid.uuid4().hex}",
+        "status": "completed",
+        "created_at": datetime.now(timezone.utc)
+    }
+
+
+def run(window_ms, threads, total_orders, max_batch, write_concern):
+    collection = client.order_bench.orders.with_options(write_concern=write_concern)
+    collection.drop()
+    collection.create_index('order_id', unique=True)
+    writer = OrderWriter(collection, window_ms=window_ms, max_batch=max_batch)
+
+    orders = [make_order(i) for i in range(total_orders)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(writer.write, orders))
+    elapsed = time.perf_counter() - started
+
+    assert collection.count_documents({}) == total_orders
+    return total_orders / elapsed, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--max-batch', type=int, default=100)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 1, 2, 5, 10])
+    parser.add_argument('--w', default='1')
+    parser.add_argument('--journal', action='store_true')
+    args = parser.parse_args()
+
+    write_concern = WriteConcern(w=int(args.w) if args.w.isdigit() else args.w, j=args.journal)
+    print(f"{args.orders} orders from {args.threads} threads, write concern {write_concern.document}")
+    print(f"{'window (ms)':>12} {'orders/sec':>12} {'elapsed (s)':>12}")
+    try:
+        for window_ms in args.windows:
+            rate, elapsed = run(window_ms, args.threads, args.orders, args.max_batch, write_concern)
+            print(f"{window_ms:>12g} {rate:>12.0f} {elapsed:>12.2f}")
+    finally:
+        client.drop_database('order_bench')
@@ -0,0 +1,68 @@
+# bench_rate_limit.py (Per-request rate-limit overhead on the login path for different storages)
+#
+# Usage: python benchmarks/bench_rate_limit.py memory:// mongodb://localhost:27017 redis://localhost:6379
+#
+# A /login request is checked against three limits (200/day, 50/hour from the
+# defaults plus the route's 5/minute), so each simulated request makes three hits.
+#
+# The counters go to a scratch namespace (database bench_rate_limit, or key prefix
+# BENCH_RATE_LIMIT) that is cleared after each run, so pointing this at the server
+# behind RATELIMIT_STORAGE_URI leaves the live counters alone. Storages that cannot
+# be given a namespace of their own are refused.
+
+import time
+import argparse
+import statistics
+
+from limits import parse_many, storage, strategies
+
+STRATEGIES = {
+    "fixed-window": strategies.FixedWindowRateLimiter,
+    "moving-window": strategies.MovingWindowRateLimiter,
+    "sliding-window-counter": strategies.SlidingWindowCounterRateLimiter,
+}
+LOGIN_LIMITS = parse_many("200/day;50/hour;5/minute")
+SCRATCH_OPTIONS = {
+    "memory": {},
+    "mongodb": {"database_name": "bench_rate_limit"},
+    "redis": {"key_prefix": "BENCH_RATE_LIMIT"},
+    "rediss": {"key_prefix": "BENCH_RATE_LIMIT"},
+}
+
+
+def scratch_options(uri):
+    """Returns the storage options that keep this benchmark's counters apart, or None."""
+    scheme = uri.split("://", 1)[0].split("+", 1)[0]
+    return SCRATCH_OPTIONS.get(scheme)
+
+
+def run(uri, strategy_name, requests, clients):
+    limiter = STRATEGIES[strategy_name](storage.storage_from_string(uri, **scratch_options(uri)))
+    timings = []
+    for i in range(requests):
+        client = f"10.0.{i % clients // 256}.{i % 256}"
+        started = time.perf_counter()
+        for limit in LOGIN_LIMITS:
+            limiter.hit(limit, "bench", "login", client)
+        timings.append((time.perf_counter() - started) * 1e6)
+    limiter.storage.reset()
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('uris', nargs='*', default=['memory://'])
+    parser.add_argument('--strategy', choices=list(STRATEGIES), default='sliding-window-counter')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=1000)
+    args = parser.parse_args()
+    unsafe = [uri for uri in args.uris if scratch_options(uri) is None]
+    if unsafe:
+        parser.error(f"no scratch namespace for {', '.join(unsafe)}; refusing to write to or reset it")
+
+    print(f"{args.requests} login requests from {args.clients} clients, strategy {args.strategy}")
+    print(f"{'storage':<40} {'mean (us)':>10} {'p50 (us)':>10} {'p99 (us)':>10}")
+    for uri in args.uris:
+        mean, p50, p99 = run(uri, args.strategy, args.requests, args.clients)
+        print(f"{uri:<40} {mean:>10.0f} {p50:>10.0f} {p99:>10.0f}")
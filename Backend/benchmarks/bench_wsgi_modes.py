@@ -0,0 +1,126 @@
+# bench_wsgi_modes.py (Throughput of one service under the dev server vs the gunicorn launcher)
+#
+# Usage: python benchmarks/bench_wsgi_modes.py product_service --path /products --concurrency 64
+#
+# Starts the service once per mode (the database from .env must be reachable),
+# drives it with concurrent keep-alive clients for a fixed time and stops it
+# again. "dev" is `python <service>.py`; the other modes go through serve.py.
+# The load generator is itself Python, so compare modes on the same machine
+# and raise --client-processes if it becomes the bottleneck.
+
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import statistics
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from serve import SERVICES, WORKER_CLASSES
+
+
+def start_service(service, mode):
+    module_name, port, _ = SERVICES[service]
+    if mode == "dev":
+        command = [sys.executable, f"{module_name}.py"]
+    else:
+        command = [sys.executable, "serve.py", service, "--worker-class", mode, "--skip-init"]
+    # A new session lets us stop the dev server's reloader child along with it.
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop_service(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def client_process(url, threads, duration):
+    """Runs `threads` closed-loop clients for `duration` seconds; returns (latencies_ms, errors)."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        local_errors = 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = session.get(url, timeout=10).ok
+            except requests.exceptions.RequestException:
+                ok = False
+            if ok:
+                local.append((time.perf_counter() - started) * 1000)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0]
+
+
+def run(url, concurrency, duration, client_processes):
+    per_process = max(1, concurrency // client_processes)
+    with ProcessPoolExecutor(max_workers=client_processes) as executor:
+        futures = [executor.submit(client_process, url, per_process, duration) for _ in range(client_processes)]
+        results = [future.result() for future in futures]
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        return 0, 0, 0, errors
+    return len(latencies) / duration, statistics.median(latencies), latencies[int(len(latencies) * 0.99)], errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('service', choices=list(SERVICES))
+    parser.add_argument('--path', default='/products')
+    parser.add_argument('--modes', nargs='+', choices=['dev'] + WORKER_CLASSES, default=['dev'] + WORKER_CLASSES)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--client-processes', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{args.service} GET {args.path}: {args.concurrency} clients for {args.duration:.0f}s per mode")
+    print(f"{'mode':<10} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'errors':>8}")
+    for mode in args.modes:
+        process, base_url = start_service(args.service, mode)
+        try:
+            url = base_url + args.path
+            wait_until_ready(url)
+            run(url, args.concurrency, args.warmup, args.client_processes)
+            throughput, p50, p99, errors = run(url, args.concurrency, args.duration, args.client_processes)
+        finally:
+            stop_service(process)
+        print(f"{mode:<10} {throughput:>10.0f} {p50:>10.1f} {p99:>10.1f} {errors:>8}")
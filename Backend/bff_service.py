@@ -0,0 +1,125 @@
+# bff_service.py (Backend-for-frontend: one call to render the buyer dashboard)
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify, request
+from flask_cors import CORS
+import requests
+from dotenv import load_dotenv
+from common.auth import buyer_required, install_preflight_handler
+from common.http import create_session
+from common.metrics import install_metrics
+from common.tracing import install_tracing, trace_span, submit_with_context
+from common.json_provider import install_json_provider
+
+load_dotenv()
+
+app = Flask(__name__)
+CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
+
+PRODUCT_SERVICE_URL = "http://product_service:5002"
+INVENTORY_SERVICE_URL = "http://inventory_service:5003"
+CART_SERVICE_URL = "http://cart_service:5004"
+WISHLIST_SERVICE_URL = "http://wishlist_service:5006"
+REVIEW_SERVICE_URL = "http://review_service:5008"
+
+SECRET_KEY = os.environ.get('SECRET_KEY')
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))
+BFF_FANOUT_WORKERS = int(os.environ.get('BFF_FANOUT_WORKERS', 16))
+BFF_CALL_TIMEOUT = float(os.environ.get('BFF_CALL_TIMEOUT', 3))
+BOOTSTRAP_PAGE_SIZE = 24
+BOOTSTRAP_MAX_PAGE_SIZE = 100
+
+if not SECRET_KEY:
+    raise RuntimeError("SECRET_KEY not found in .env file")
+
+# One keep-alive pool per downstream host, shared by all fan-out threads.
+service_session = create_session(HTTP_POOL_SIZE, pool_connections=5)
+fanout_executor = ThreadPoolExecutor(max_workers=BFF_FANOUT_WORKERS, thread_name_prefix="bff-fanout")
+
+def fetch_json(method, url, **kwargs):
+    response = service_session.request(method, url, timeout=BFF_CALL_TIMEOUT, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+def fan_out(calls):
+    """Runs {name: (method, url, kwargs)} concurrently.
+
+    Returns ({name: result}, [names that failed]); a failed call never fails the others.
+    """
+    futures = {name: submit_with_context(fanout_executor, fetch_json, method, url, **kwargs)
+               for name, (method, url, kwargs) in calls.items()}
+    results, errors = {}, []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"!!! WARNING: Bootstrap call '{name}' failed. Error: {e}")
+            errors.append(name)
+    return results, errors
+
+@app.route("/buyer/bootstrap", methods=['GET', 'OPTIONS'])
+@buyer_required
+def buyer_bootstrap(current_user_id):
+    """Everything the buyer dashboard needs for its first paint, in one response.
+
+    Query: limit (page size), after (product id cursor from next_cursor).
+    Sections that could not be loaded are left empty and named in "errors".
+    """
+    limit = max(1, min(request.args.get('limit', BOOTSTRAP_PAGE_SIZE, type=int), BOOTSTRAP_MAX_PAGE_SIZE))
+    page_params = {"limit": limit}
+    if request.args.get('after'):
+        page_params["after"] = request.args['after']
+
+    # Stage 1: the product page and the user's own lists are independent.
+    with trace_span("fan-out: page, cart, wishlist"):
+        first, errors = fan_out({
+            "products": ("GET", f"{PRODUCT_SERVICE_URL}/products", {"params": page_params}),
+            "cart": ("GET", f"{CART_SERVICE_URL}/cart/{current_user_id}", {}),
+            "wishlist": ("GET", f"{WISHLIST_SERVICE_URL}/wishlist/{current_user_id}", {}),
+        })
+    page = first.get("products") or {}
+    products = page.get("products", [])
+    cart = first.get("cart", [])
+    wishlist = first.get("wishlist", [])
+
+    # Stage 2: everything keyed by the product IDs found in stage 1.
+    page_ids = [product['id'] for product in products]
+    listed_ids = set(page_ids)
+    other_ids = sorted(({item['product_id'] for item in cart} | set(wishlist)) - listed_ids)
+    stock_ids = page_ids + other_ids
+    calls = {}
+    if page_ids:
+        calls["ratings"] = ("POST", f"{REVIEW_SERVICE_URL}/reviews/averages", {"json": {"product_ids": page_ids}})
+    if stock_ids:
+        calls["inventory"] = ("GET", f"{INVENTORY_SERVICE_URL}/inventory", {"params": {"product_ids": ",".join(stock_ids)}})
+    if other_ids:
+        # Cart and wishlist items that are not on this page still need a name and price.
+        calls["product_details"] = ("GET", f"{PRODUCT_SERVICE_URL}/products", {"params": {"ids": ",".join(other_ids)}})
+    with trace_span("fan-out: ratings, inventory, details"):
+        second, more_errors = fan_out(calls)
+    errors.extend(more_errors)
+
+    return jsonify({
+        "products": products,
+        "next_cursor": page.get("next_cursor"),
+        "cart": cart,
+        "wishlist": wishlist,
+        "inventory": second.get("inventory", []),
+        "ratings": second.get("ratings", {}),
+        "product_details": second.get("product_details", []),
+        "errors": errors
+    }), 200
+
+def init_db():
+    # Nothing to set up: this service owns no data, it only calls the others.
+    pass
+
+if __name__ == '__main__':
+    init_db()
+    # We use port 5009; 5001-5008 are taken by the services this one calls.
+    app.run(host='0.0.0.0', port=5009, debug=True)
@@ -0,0 +1,110 @@
+# captcha_pool.py (Keeps pre-rendered CAPTCHA challenges ready for user_services)
+
+import time
+import base64
+import string
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from captcha.image import ImageCaptcha
+
+from common.process import PerProcess, start_thread
+
+CAPTCHA_ALPHABET = string.ascii_uppercase + string.digits
+CAPTCHA_LENGTH = 6
+
+_image_captcha = None
+
+
+def render_captcha():
+    """Renders one challenge and returns (text, data URI).
+
+    Runs inside the pool's worker processes, so it only touches module state
+    that is safe to build lazily in each of them.
+    """
+    global _image_captcha
+    if _image_captcha is None:
+        _image_captcha = ImageCaptcha(width=280, height=90)
+    text = "".join(secrets.choice(CAPTCHA_ALPHABET) for _ in range(CAPTCHA_LENGTH))
+    img_bytes = _image_captcha.generate(text).getvalue()
+    return text, f"data:image/png;base64,{base64.b64encode(img_bytes).decode('utf-8')}"
+
+
+class CaptchaPool:
+    """A bounded pool of pre-rendered challenges, refilled by a process pool.
+
+    take() never waits for the refill: when the pool is empty it renders the
+    challenge inline, exactly as the request path did before.
+    """
+
+    def __init__(self, size=200, workers=1, low_watermark=None):
+        self.size = size
+        self.workers = workers
+        self.low_watermark = size // 2 if low_watermark is None else low_watermark
+        self.stats = {
+            "served_from_pool": 0,
+            "rendered_inline": 0,
+            "rendered_in_background": 0,
+            "refills": 0,
+            "last_refill_seconds": 0.0,
+        }
+        self._ready = deque(maxlen=max(size, 1))
+        self._wakeup = threading.Event()
+        self._refiller = PerProcess(self._start_refill)
+
+    def take(self):
+        if self.size <= 0:
+            self.stats["rendered_inline"] += 1
+            return render_captcha()
+
+        self._refiller.get()
+        try:
+            challenge = self._ready.popleft()
+            self.stats["served_from_pool"] += 1
+        except IndexError:
+            challenge = render_captcha()
+            self.stats["rendered_inline"] += 1
+        if len(self._ready) < self.low_watermark:
+            self._wakeup.set()
+        return challenge
+
+    def metrics(self):
+        return {"pool_size": len(self._ready), "pool_capacity": self.size, **self.stats}
+
+    # hits/misses let the pool be reported like a cache: a miss is an inline render.
+    @property
+    def hits(self):
+        return self.stats["served_from_pool"]
+
+    @property
+    def misses(self):
+        return self.stats["rendered_inline"]
+
+    def _start_refill(self):
+        self._ready.clear()
+        self._wakeup.set()
+        return start_thread(self._refill_loop, "captcha-refill")
+
+    def _refill_loop(self):
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                missing = self.size - len(self._ready)
+                if missing <= 0:
+                    continue
+                started = time.monotonic()
+                try:
+                    futures = [executor.submit(render_captcha) for _ in range(missing)]
+                    for future in futures:
+                        self._ready.append(future.result())
+                        self.stats["rendered_in_background"] += 1
+                except Exception as e:
+                    print(f"!!! WARNING: CAPTCHA pool refill failed. Error: {e}")
+                    time.sleep(1)
+                    self._wakeup.set()
+                    continue
+                self.stats["refills"] += 1
+                self.stats["last_refill_seconds"] = round(time.monotonic() - started, 3)
@@ -0,0 +1,40 @@
+# captcha_store.py (Where user_services keeps issued CAPTCHA answers until they are checked)
+
+from datetime import datetime, timezone, timedelta
+
+from common.cache import TTLCache
+
+
+class MemoryCaptchaStore:
+    """Per-process LRU store with expiry. Only correct with a single worker process."""
+
+    def __init__(self, ttl=300, max_size=10000):
+        self._answers = TTLCache(max_size=max_size, ttl=ttl)
+
+    def ensure_indexes(self):
+        pass
+
+    def put(self, captcha_id, answer):
+        self._answers.set(captcha_id, answer)
+
+    def pop(self, captcha_id):
+        return self._answers.pop(captcha_id)
+
+
+class MongoCaptchaStore:
+    """Store shared by every worker and replica, expired by a TTL index."""
+
+    def __init__(self, collection, ttl=300):
+        self.collection = collection
+        self.ttl = timedelta(seconds=ttl)
+
+    def ensure_indexes(self):
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def put(self, captcha_id, answer):
+        self.collection.insert_one({'_id': captcha_id, 'answer': answer, 'expires_at': datetime.now(timezone.utc) + self.ttl})
+
+    def pop(self, captcha_id):
+        # The TTL monitor only runs once a minute, so expiry is also checked here.
+        entry = self.collection.find_one_and_delete({'_id': captcha_id, 'expires_at': {'$gt': datetime.now(timezone.utc)}})
+        return entry['answer'] if entry else None
@@ -1,10 +1,13 @@
 # cart_service.py (Corrected to use .env and include remove functionality)
 
 import os
-from pymongo import MongoClient
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv # Import the dotenv library
+from common.mongo import create_client
+from common.metrics import install_metrics
+from common.tracing import install_tracing
+from common.json_provider import install_json_provider
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,6 +15,9 @@ load_dotenv()
 # 1. --- SETUP ---
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["null", "http://127.0.0.1:8080", "http://localhost:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_tracing(app)
+install_json_provider(app)
 
 # --- MONGODB ATLAS CONNECTION ---
 # Securely load the URI from the environment variable defined in your .env file
@@ -20,7 +26,7 @@ MONGO_URI = os.environ.get('CART_DB_URI')
 if not MONGO_URI:
     raise RuntimeError("CART_DB_URI not found in .env file")
 
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.cart_db
 carts_collection = db.carts
 
@@ -115,9 +121,11 @@ def clear_cart(user_id):
         print(f"Database error: {e}")
         return jsonify({"message": "Error clearing cart"}), 500
 
-# 3. --- RUN THE APPLICATION ---
-if __name__ == '__main__':
+def init_db():
     carts_collection.create_index('user_id', unique=True)
     print("MongoDB cart 'user_id' index checked/created.")
-    app.run(host='0.0.0.0', port=5004, debug=True)
 
+# 3. --- RUN THE APPLICATION ---
+if __name__ == '__main__':
+    init_db()
+    app.run(host='0.0.0.0', port=5004, debug=True)
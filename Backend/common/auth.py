@@ -0,0 +1,76 @@
+import os
+import time
+from functools import wraps
+
+import jwt
+from dotenv import load_dotenv
+from flask import request, jsonify
+
+from common.cache import TTLCache
+from common.metrics import metrics
+
+load_dotenv()
+
+SECRET_KEY = os.environ.get('SECRET_KEY')
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 4096))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+
+# Verified token -> claims. A page load reuses the same access token for dozens
+# of calls, so most requests skip the HMAC check. Entries never outlive 'exp'.
+token_cache = TTLCache(max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+metrics.register_cache('jwt_claims', token_cache)
+
+
+def decode_token(token):
+    """Returns the claims of a valid access token, or raises jwt.InvalidTokenError."""
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    exp = claims.get('exp')
+    ttl = TOKEN_CACHE_TTL if exp is None else min(TOKEN_CACHE_TTL, exp - time.time())
+    if ttl > 0:
+        token_cache.set(token, claims, ttl=ttl)
+    return claims
+
+
+def require_roles(*roles, claims_kwarg=None, subject_kwarg=None):
+    """Builds a decorator that only lets through tokens whose role is in roles.
+
+    claims_kwarg / subject_kwarg name the view keyword argument that receives
+    the decoded claims / the token subject (username).
+    """
+    article = 'an' if roles[0][0] in 'aeiou' else 'a'
+    forbidden_message = f"This action requires {article} {' or '.join(roles)} account!"
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            token = request.headers.get('Authorization', ' ').split(" ")[-1]
+            if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
+            try:
+                data = decode_token(token)
+            except jwt.InvalidTokenError:
+                return jsonify({'message': 'Token is invalid or expired!'}), 401
+            if data.get('role') not in roles:
+                return jsonify({'message': forbidden_message}), 403
+            if claims_kwarg:
+                kwargs[claims_kwarg] = data
+            if subject_kwarg:
+                kwargs[subject_kwarg] = data.get('sub')
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+admin_required = require_roles('admin')
+seller_required = require_roles('seller', 'admin', claims_kwarg='current_user')
+buyer_required = require_roles('buyer', 'admin', subject_kwarg='current_user_id')
+
+
+def install_preflight_handler(app):
+    """Answers every CORS preflight before routing, so OPTIONS never reaches auth or views."""
+    @app.before_request
+    def answer_preflight():
+        if request.method == 'OPTIONS':
+            return app.make_default_options_response()
@@ -0,0 +1,117 @@
+import os
+import gzip
+import decimal
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # only gzip is offered then
+    brotli = None
+
+load_dotenv()
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 5))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain"}
+
+
+def utc_isoformat(value):
+    """ISO 8601 in UTC with a 'Z' suffix. Naive datetimes (as pymongo returns them) are UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _default(o):
+    if isinstance(o, datetime):
+        return utc_isoformat(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    return DefaultJSONProvider.default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed.
+
+    Both paths write datetimes as UTC ISO 8601 ("2025-01-31T09:30:00Z")
+    instead of Flask's RFC 822 dates. Keys are not sorted. Anything orjson
+    refuses (e.g. integers beyond 64 bits) goes through the stdlib encoder.
+    """
+
+    default = staticmethod(_default)
+    sort_keys = False
+
+    if orjson is not None:
+        _orjson_options = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(self, obj, indent=False):
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default,
+                                    option=self._orjson_options | (orjson.OPT_INDENT_2 if indent else 0))
+            except TypeError:
+                pass
+        separators = None if indent else (",", ":")
+        return super().dumps(obj, indent=2 if indent else None, separators=separators).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent=indent) + b"\n", mimetype=self.mimetype)
+
+
+def compress_response(response):
+    """Brotli- or gzip-encodes a response body above COMPRESS_MIN_BYTES if the client accepts it."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code == 204
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def install_json_provider(app, compress=True):
+    """Switches app to FastJSONProvider and compresses large responses.
+
+    Call it after the other install_* hooks: after_request functions run in
+    reverse order, so compression then happens before timings are recorded.
+    """
+    app.json = FastJSONProvider(app)
+    if compress and os.environ.get('COMPRESS_RESPONSES', 'true').lower() == 'true':
+        app.after_request(compress_response)
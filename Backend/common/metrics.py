@@ -0,0 +1,225 @@
+import os
+import glob
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+
+from flask import Response, g, request
+from pymongo import monitoring
+
+from common.process import PerProcess, start_thread
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    "http_request_duration_seconds": "Time spent handling HTTP requests.",
+    "mongodb_command_duration_seconds": "Time spent in MongoDB commands, as measured by the driver.",
+    "http_client_request_duration_seconds": "Time spent in outbound HTTP calls to other services.",
+    "cache_hits_total": "Cache lookups that found a live entry.",
+    "cache_misses_total": "Cache lookups that found nothing or an expired entry.",
+    "cache_hit_ratio": "Share of cache lookups that were hits.",
+}
+
+
+class Metrics:
+    """Latency histograms and cache counters for one service process.
+
+    Recording never takes a lock: observe() appends to a deque (atomic in
+    CPython) and the observations are folded into histograms when the
+    metrics are read, or by whichever caller first finds the backlog longer
+    than max_pending.
+
+    Under gunicorn every worker has its own instance. With a directory set,
+    each worker writes its totals there every flush_interval seconds and
+    render() merges all of them, so a scrape sees the whole service no matter
+    which worker answers it.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0, max_pending=10000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._histograms = {}   # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._caches = {}
+        self._fold_lock = threading.Lock()
+        self._flusher = PerProcess(self._start_flusher)
+
+    def observe(self, name, labels, seconds):
+        """Records one duration. labels is a tuple of (key, value) pairs."""
+        self._pending.append((name, labels, seconds))
+        if len(self._pending) > self.max_pending and self._fold_lock.acquire(blocking=False):
+            try:
+                self._fold()
+            finally:
+                self._fold_lock.release()
+        if self.directory:
+            self._flusher.get()
+
+    def register_cache(self, name, cache):
+        """Reports cache.hits / cache.misses (any object that has both)."""
+        self._caches[name] = cache
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        if self.directory:
+            self._write(snapshot)
+            snapshot = self._merge_worker_files()
+        return _format(snapshot)
+
+    def snapshot(self):
+        with self._fold_lock:
+            self._fold()
+            histograms = [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()]
+        counters = []
+        for cache_name, cache in list(self._caches.items()):
+            counters.append(["cache_hits_total", [["cache", cache_name]], cache.hits])
+            counters.append(["cache_misses_total", [["cache", cache_name]], cache.misses])
+        return {"histograms": histograms, "counters": counters}
+
+    def _fold(self):
+        # Callers hold _fold_lock.
+        while True:
+            try:
+                name, labels, seconds = self._pending.popleft()
+            except IndexError:
+                return
+            values = self._histograms.get((name, labels))
+            if values is None:
+                values = self._histograms[(name, labels)] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            values[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            values[-1] += seconds
+
+    # --- Worker files (gunicorn) ---
+    def _start_flusher(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return start_thread(self._flush_loop, "metrics-flush")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self._write(self.snapshot())
+            except Exception as e:
+                print(f"!!! WARNING: Could not write metrics. Error: {e}")
+
+    def _write(self, snapshot):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+
+    def _merge_worker_files(self):
+        # Files of exited workers are kept, so counters never go backwards.
+        histograms, counters = {}, {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [0] * len(values))
+                histograms[key] = [a + b for a, b in zip(merged, values)]
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+        return {
+            "histograms": [[name, labels, values] for (name, labels), values in histograms.items()],
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        }
+
+
+def _labels_text(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format(snapshot):
+    lines = []
+    by_name = {}
+    for name, labels, values in sorted(snapshot["histograms"], key=lambda h: (h[0], h[1])):
+        by_name.setdefault(name, []).append((labels, values))
+    for name, series in by_name.items():
+        lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels_text(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_labels_text(labels)} {cumulative}")
+
+    counters = {}
+    for name, labels, value in sorted(snapshot["counters"], key=lambda c: (c[0], c[1])):
+        counters.setdefault(name, []).append((labels, value))
+    for name, series in counters.items():
+        lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{_labels_text(labels)} {value}" for labels, value in series)
+
+    hits = {tuple(map(tuple, labels)): value for labels, value in counters.get("cache_hits_total", [])}
+    misses = {tuple(map(tuple, labels)): value for labels, value in counters.get("cache_misses_total", [])}
+    if hits:
+        lines.append(f"# HELP cache_hit_ratio {METRIC_HELP['cache_hit_ratio']}")
+        lines.append("# TYPE cache_hit_ratio gauge")
+        for labels, hit_count in hits.items():
+            lookups = hit_count + misses.get(labels, 0)
+            lines.append(f"cache_hit_ratio{_labels_text(labels)} {hit_count / lookups if lookups else 0}")
+    return "\n".join(lines) + "\n"
+
+
+# One registry per process. serve.py points METRICS_DIR at a per-service
+# directory so the gunicorn workers' numbers are merged.
+metrics = Metrics(directory=os.environ.get('METRICS_DIR'))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command using the driver's own measurement."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.observe("mongodb_command_duration_seconds",
+                        (("database", event.database_name), ("command", event.command_name), ("status", "ok")),
+                        event.duration_micros / 1e6)
+
+    def failed(self, event):
+        metrics.observe("mongodb_command_duration_seconds",
+                        (("database", event.database_name), ("command", event.command_name), ("status", "error")),
+                        event.duration_micros / 1e6)
+
+
+def install_metrics(app):
+    """Times every request by route and status, and serves GET /metrics.
+
+    Call it before any other before_request hook so preflights are timed too.
+    """
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # The URL rule, not the path, keeps IDs out of the labels.
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.observe("http_request_duration_seconds",
+                            (("method", request.method), ("route", route), ("status", str(response.status_code))),
+                            time.perf_counter() - started)
+        return response
+
+    @app.route("/metrics", methods=['GET'])
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,57 @@
+import os
+
+from pymongo import MongoClient
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from common.metrics import MongoCommandMetrics
+from common.tracing import MongoCommandTracing
+
+
+def create_client(uri):
+    """Builds the MongoClient for one worker process.
+
+    Pool sizes come from env so they can be matched to the worker model: a
+    sync worker only needs a few connections, a gevent worker may need one per
+    concurrent greenlet.
+
+    Env: MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_COMPRESSORS (comma separated, tried in order; "" disables compression).
+    """
+    options = {
+        "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+        "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+        "maxIdleTimeMS": int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000)),
+        "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+        "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+        "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        "socketTimeoutMS": int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)),
+        "retryWrites": True,
+        "retryReads": True,
+        "appname": os.environ.get('MONGO_APP_NAME', 'microshop'),
+        "event_listeners": [MongoCommandMetrics(), MongoCommandTracing()],
+    }
+    # The server picks the first one it supports. pymongo skips (with a warning)
+    # any compressor whose library is missing, e.g. snappy without python-snappy,
+    # so zlib at the end keeps compression on either way.
+    compressors = os.environ.get('MONGO_COMPRESSORS', 'zstd,zlib')
+    if compressors:
+        options["compressors"] = compressors
+        options["zlibCompressionLevel"] = int(os.environ.get('MONGO_ZLIB_LEVEL', 1))
+    return MongoClient(uri, **options)
+
+
+def secondary_reads(collection):
+    """Returns a view of collection whose reads prefer secondaries.
+
+    Use it for reads that tolerate replication lag (public catalog and review
+    listings, admin analytics). Writes through the view still go to the
+    primary, and on a standalone server or when MONGO_SECONDARY_READS=false it
+    behaves exactly like the collection itself.
+    MONGO_MAX_STALENESS_SECONDS (>= 90) skips secondaries that lag further behind.
+    """
+    if os.environ.get('MONGO_SECONDARY_READS', 'true').lower() != 'true':
+        return collection.with_options(read_preference=Primary())
+    max_staleness = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', -1))
+    return collection.with_options(read_preference=SecondaryPreferred(max_staleness=max_staleness))
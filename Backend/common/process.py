@@ -0,0 +1,36 @@
+import os
+import threading
+
+
+class PerProcess:
+    """Holds one value per process, built by factory() on the first get() in it.
+
+    The services keep their background threads and process pools behind
+    this. serve.py does not preload the app, so each gunicorn worker imports
+    the service module after the fork and builds its own on first use; nothing
+    starts at import time, which keeps init_db() runs and scripts free of
+    threads. The pid check covers a process forked after first use (such as a
+    fork-started pool child), which would otherwise reuse threads it does not have.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._pid = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._value = self.factory()
+                    self._pid = pid
+        return self._value
+
+
+def start_thread(target, name):
+    """Starts target in a daemon thread and returns the thread."""
+    thread = threading.Thread(target=target, daemon=True, name=name)
+    thread.start()
+    return thread
@@ -0,0 +1,199 @@
+import os
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from flask import g, request
+from pymongo import monitoring
+
+load_dotenv()
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PARENT_SPAN_HEADER = "X-Parent-Span-ID"
+TRACE_LOG_REQUESTS = os.environ.get('TRACE_LOG_REQUESTS', 'true').lower() == 'true'
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+TRACE_MAX_SPANS = int(os.environ.get('TRACE_MAX_SPANS', 500))
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+# Kept apart from the trace so that threads started with submit_with_context
+# nest their spans under the span that was open when they were submitted.
+_active_span_id = contextvars.ContextVar('active_span_id', default=None)
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "kind", "start", "duration", "token")
+
+    def __init__(self, name, kind, parent_id, start=None, duration=None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter() if start is None else start
+        self.duration = duration
+        self.token = None
+
+
+class Trace:
+    """The spans recorded while one request is handled in this service.
+
+    request_id is shared by every service the request passes through, so the
+    logs of all hops can be joined on it; parent_id is the span in the calling
+    service that this request hangs under.
+    """
+
+    def __init__(self, request_id, parent_id=None):
+        self.request_id = request_id
+        self.parent_id = parent_id
+        self.spans = []
+        self.dropped = 0
+        self._mongo_commands = {}
+
+    @property
+    def current_span_id(self):
+        return _active_span_id.get() or self.parent_id
+
+    def open(self, name, kind):
+        span = Span(name, kind, self.current_span_id)
+        self._add(span)
+        span.token = _active_span_id.set(span.span_id)
+        return span
+
+    def close(self, span):
+        span.duration = time.perf_counter() - span.start
+        _active_span_id.reset(span.token)
+
+    def record(self, name, kind, duration):
+        """Adds an already finished span that ends now."""
+        self._add(Span(name, kind, self.current_span_id, start=time.perf_counter() - duration, duration=duration))
+
+    def _add(self, span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+
+@contextmanager
+def trace_span(name, kind="internal"):
+    """Times a block as a child of the current span. Does nothing outside a request."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    span = trace.open(name, kind)
+    try:
+        yield
+    finally:
+        trace.close(span)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """executor.submit() that runs fn inside the caller's trace."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def outgoing_headers():
+    """Headers that carry the current request ID and span to another service."""
+    trace = current_trace.get()
+    if trace is None:
+        return {}
+    return {REQUEST_ID_HEADER: trace.request_id, PARENT_SPAN_HEADER: trace.current_span_id or ""}
+
+
+class MongoCommandTracing(monitoring.CommandListener):
+    """Adds a span for every MongoDB command issued while handling a request."""
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is not None:
+            collection = event.command.get(event.command_name)
+            target = f"{event.database_name}.{collection}" if isinstance(collection, str) else event.database_name
+            trace._mongo_commands[event.request_id] = f"mongo {event.command_name} {target}"
+
+    def succeeded(self, event):
+        self._finish(event, "")
+
+    def failed(self, event):
+        self._finish(event, " failed")
+
+    def _finish(self, event, suffix):
+        trace = current_trace.get()
+        if trace is not None:
+            name = trace._mongo_commands.pop(event.request_id, f"mongo {event.command_name}")
+            trace.record(name + suffix, "db", event.duration_micros / 1e6)
+
+
+def _summary(trace):
+    totals = {}
+    for span in trace.spans[1:]:
+        if span.kind in ("db", "http"):
+            count, seconds = totals.get(span.kind, (0, 0.0))
+            totals[span.kind] = (count + 1, seconds + (span.duration or 0))
+    return ", ".join(f"{kind} {seconds * 1000:.1f}ms x{count}" for kind, (count, seconds) in sorted(totals.items()))
+
+
+def _span_tree(trace):
+    root = trace.spans[0]
+    children = {}
+    for span in trace.spans[1:]:
+        children.setdefault(span.parent_id, []).append(span)
+    lines = []
+
+    def walk(span, depth):
+        offset = (span.start - root.start) * 1000
+        duration = (span.duration or 0) * 1000
+        lines.append(f"  +{offset:8.1f}ms {duration:8.1f}ms  {'  ' * depth}{span.name}")
+        for child in sorted(children.get(span.span_id, []), key=lambda s: s.start):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    if trace.dropped:
+        lines.append(f"  ... {trace.dropped} more spans not recorded")
+    return "\n".join(lines)
+
+
+def install_tracing(app):
+    """Starts a trace for every request and logs its span timings.
+
+    The request ID comes from the X-Request-ID header, or is created here when
+    this service is the edge. It is echoed in the response and forwarded by
+    common.http sessions. Requests slower than SLOW_REQUEST_MS dump their
+    whole span tree.
+    """
+    @app.before_request
+    def start_trace():
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        # The ID ends up in every log line, so anything odd from a client is replaced.
+        if not request_id or len(request_id) > 128 or not request_id.isprintable() or ' ' in request_id:
+            request_id = uuid.uuid4().hex
+        trace = Trace(request_id, request.headers.get(PARENT_SPAN_HEADER, '')[:32] or None)
+        g.trace_token = current_trace.set(trace)
+        g.span_token = _active_span_id.set(None)
+        g.trace_root = trace.open(f"{request.method} {request.path}", "server")
+
+    @app.after_request
+    def finish_trace(response):
+        trace = current_trace.get()
+        if trace is None or 'trace_root' not in g:
+            return response
+        trace.close(g.pop('trace_root'))
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        total_ms = trace.spans[0].duration * 1000
+        line = f"[{trace.request_id}] {request.method} {request.path} {response.status_code} {total_ms:.1f}ms"
+        summary = _summary(trace)
+        if total_ms >= SLOW_REQUEST_MS:
+            print(f"SLOW REQUEST {line} ({summary or 'no db/http calls'})\n{_span_tree(trace)}")
+        elif TRACE_LOG_REQUESTS:
+            print(f"{line}{f' ({summary})' if summary else ''}")
+        return response
+
+    @app.teardown_request
+    def clear_trace(error=None):
+        span_token = g.pop('span_token', None)
+        if span_token is not None:
+            _active_span_id.reset(span_token)
+        token = g.pop('trace_token', None)
+        if token is not None:
+            current_trace.reset(token)
@@ -1,15 +1,21 @@
 import os
-from pymongo import MongoClient
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-import jwt
-from functools import wraps
+from common.auth import admin_required, install_preflight_handler
+from common.mongo import create_client
+from common.metrics import install_metrics
+from common.tracing import install_tracing
+from common.json_provider import install_json_provider
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
 
 MONGO_URI = os.environ.get('INVENTORY_DB_URI')
 SECRET_KEY = os.environ.get('SECRET_KEY')
@@ -17,26 +23,10 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 if not MONGO_URI or not SECRET_KEY:
     raise RuntimeError("Database URI or SECRET_KEY not found in .env file")
 
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.inventory_db
 inventory_collection = db.inventory
 
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') != 'admin': return jsonify({'message': 'This action requires an admin account!'}), 403
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
 def seed_database():
     if inventory_collection.count_documents({}) == 0:
         seed_data = [
@@ -50,8 +40,11 @@ def seed_database():
 
 @app.route("/inventory", methods=['GET'])
 def get_public_inventory():
+    """Stock levels for every product, or only for ?product_ids=P1,P2."""
+    product_ids = request.args.get('product_ids')
+    query = {'product_id': {'$in': [p for p in product_ids.split(',') if p]}} if product_ids is not None else {}
     try:
-        all_stock = list(inventory_collection.find({}, {'_id': 0}))
+        all_stock = list(inventory_collection.find(query, {'_id': 0}))
         return jsonify(all_stock), 200
     except Exception as e:
         print(f"Database error: {e}")
@@ -132,10 +125,12 @@ def update_inventory():
         print(f"Database error: {e}")
         return jsonify({"message": "Error updating inventory"}), 500
 
-if __name__ == '__main__':
+def init_db():
     inventory_collection.create_index('product_id', unique=True)
     print("MongoDB inventory 'product_id' index checked/created.")
-    
+
     seed_database()
-    
-    app.run(host='0.0.0.0', port=5003, debug=True)
\ No newline at end of file
+
+if __name__ == '__main__':
+    init_db()
+    app.run(host='0.0.0.0', port=5003, debug=True)
@@ -0,0 +1,50 @@
+# mail_sink.py (Local stand-in for the Mailgun messages API, for testing OTP delivery)
+#
+# Point user_services at it with MAILGUN_API_BASE=http://mail_sink:5010 (or
+# http://localhost:5010). Received messages are printed and kept in memory.
+
+import os
+import json
+import time
+import random
+from collections import deque
+from datetime import datetime, timezone
+from flask import Flask, request, jsonify
+
+app = Flask(__name__)
+
+MAIL_SINK_LATENCY_MS = int(os.environ.get('MAIL_SINK_LATENCY_MS', 0))
+MAIL_SINK_FAILURE_RATE = float(os.environ.get('MAIL_SINK_FAILURE_RATE', 0))
+received_messages = deque(maxlen=1000)
+
+@app.route("/v3/<string:domain>/messages", methods=['POST'])
+def receive_message(domain):
+    if MAIL_SINK_LATENCY_MS:
+        time.sleep(MAIL_SINK_LATENCY_MS / 1000)
+    if random.random() < MAIL_SINK_FAILURE_RATE:
+        return jsonify({"message": "Simulated provider failure"}), 503
+
+    recipients = request.form.getlist('to')
+    variables = json.loads(request.form.get('recipient-variables', '{}'))
+    for recipient in recipients:
+        text = request.form.get('text', '')
+        for name, value in variables.get(recipient, {}).items():
+            text = text.replace(f"%recipient.{name}%", str(value))
+        received_messages.append({
+            "domain": domain,
+            "from": request.form.get('from'),
+            "to": recipient,
+            "subject": request.form.get('subject'),
+            "text": text,
+            "received_at": datetime.now(timezone.utc).isoformat()
+        })
+        print(f"[mail_sink] To {recipient}: {text.splitlines()[0] if text else ''}")
+    return jsonify({"id": f"<{time.time_ns()}@mail_sink>", "message": "Queued. Thank you."}), 200
+
+@app.route("/messages", methods=['GET'])
+def list_messages():
+    recipient = request.args.get('to')
+    return jsonify([m for m in received_messages if not recipient or m['to'] == recipient])
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5010, debug=True)
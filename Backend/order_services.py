@@ -1,103 +1,311 @@
 import os
-from pymongo import MongoClient, DESCENDING
+from pymongo import DESCENDING, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+from pymongo.read_concern import ReadConcern
 import json
 import uuid
+import time
+import queue
+import threading
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 import requests
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
-import jwt
-from functools import wraps
+from common.auth import admin_required, seller_required, buyer_required, install_preflight_handler
+from common.mongo import create_client, secondary_reads
+from common.http import create_session
+from common.metrics import install_metrics
+from common.tracing import install_tracing, trace_span
+from common.json_provider import install_json_provider
+from common.process import PerProcess, start_thread
+from reconcile_purchases_job import reconcile_purchases
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
 
 PRODUCT_SERVICE_URL = "http://product_service:5002"
 INVENTORY_SERVICE_URL = "http://inventory_service:5003"
 CART_SERVICE_URL = "http://cart_service:5004"
 PAYMENT_SERVICE_URL = "http://payment_service:5007"
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))
+# Order IDs for keyed checkouts are derived from (user, Idempotency-Key), so a retry maps to the same order and payment.
+ORDER_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, 'orders.microshop')
+
+# One keep-alive pool per worker for the calls to cart/product/inventory/payment.
+service_session = create_session(HTTP_POOL_SIZE, pool_connections=4)
 
 MONGO_URI = os.environ.get('ORDER_DB_URI')
 SECRET_KEY = os.environ.get('SECRET_KEY')
+ORDER_WRITE_BATCH_WINDOW_MS = float(os.environ.get('ORDER_WRITE_BATCH_WINDOW_MS', 5))
+ORDER_WRITE_MAX_BATCH = int(os.environ.get('ORDER_WRITE_MAX_BATCH', 100))
+# Unset by default, so order writes use the deployment's default write concern (majority on MongoDB 5.0+).
+ORDER_WRITE_CONCERN_W = os.environ.get('ORDER_WRITE_CONCERN_W')
+ORDER_WRITE_JOURNAL = os.environ.get('ORDER_WRITE_JOURNAL')
+ORDER_HOOK_ATTEMPTS = int(os.environ.get('ORDER_HOOK_ATTEMPTS', 3))
 if not MONGO_URI or not SECRET_KEY:
     raise RuntimeError("Database URI or SECRET_KEY not found in .env file")
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.order_db
 orders_collection = db.orders
+purchases_collection = db.purchases
+archived_orders_collection = db.orders_archive
+order_meta_collection = db.order_meta
+# One entry per keyed checkout in progress (_id = order_id), claimed before any side effect.
+checkout_claims_collection = db.checkout_claims
+CHECKOUT_CLAIM_TTL_SECONDS = int(os.environ.get('CHECKOUT_CLAIM_TTL_SECONDS', 3600))
+DUPLICATE_KEY_ERROR = 11000
+# Admin listings and analytics may read from secondaries; checkout and purchase checks stay on the primary.
+orders_replica = secondary_reads(orders_collection)
+archived_orders_replica = secondary_reads(archived_orders_collection)
 
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') != 'admin': return jsonify({'message': 'This action requires an admin account!'}), 403
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
-def seller_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
+def get_archive_cutoff():
+    """Returns the date before which orders may live in the archive tier, or None."""
+    state = order_meta_collection.find_one({'_id': 'archive'})
+    if not state or not state.get('cutoff'):
+        return None
+    return state['cutoff'].replace(tzinfo=timezone.utc)
+
+def needs_archive(created_at_filter):
+    cutoff = get_archive_cutoff()
+    if cutoff is None:
+        return False
+    start = created_at_filter.get('$gte')
+    return start is None or start < cutoff
+
+def find_orders(query, created_at_filter=None, secondary=False):
+    """Finds orders newest first, reading the archive tier only when the range reaches it.
+
+    secondary=True lets the reads go to a secondary, for callers that tolerate lag.
+    """
+    created_at_filter = created_at_filter or {}
+    if created_at_filter:
+        query = {**query, "created_at": created_at_filter}
+    hot, archive = (orders_replica, archived_orders_replica) if secondary else (orders_collection, archived_orders_collection)
+    orders = list(hot.find(query, {'_id': 0}).sort('created_at', DESCENDING))
+    if needs_archive(created_at_filter):
+        # Everything archived is older than everything still hot, so appending keeps the order.
+        # A batch the archive job has copied but not yet deleted is in both tiers; keep the hot copy.
+        hot_ids = {order['order_id'] for order in orders}
+        orders.extend(order for order in archive.find(query, {'_id': 0}).sort('created_at', DESCENDING)
+                      if order['order_id'] not in hot_ids)
+    return orders
+
+def aggregate_orders(match_query, stages):
+    """Runs an analytics aggregation over orders, unioning in the archive tier when needed.
+
+    Always reads from a secondary when one is available.
+    """
+    pipeline = [{"$match": match_query}]
+    if needs_archive(match_query.get('created_at', {})):
+        pipeline += [
+            {"$unionWith": {"coll": archived_orders_collection.name, "pipeline": [{"$match": match_query}]}},
+            # A batch the archive job has copied but not yet deleted is in both tiers; count it once.
+            {"$group": {"_id": "$order_id", "order": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$order"}}
+        ]
+    return list(orders_replica.aggregate(pipeline + stages, allowDiskUse=True))
+
+def record_purchases(orders):
+    """Upserts one (user_id, product_id) entry per purchased product for fast verification."""
+    operations = [
+        UpdateOne(
+            {"user_id": order['user_id'], "product_id": item['product_id']},
+            {"$setOnInsert": {"order_id": order['order_id'], "purchased_at": order['created_at']}},
+            upsert=True
+        )
+        for order in orders if order.get('status') == 'completed'
+        for item in order['items']
+    ]
+    if operations:
+        purchases_collection.bulk_write(operations, ordered=False)
+
+def backfill_purchases():
+    """Builds the purchases collection from order history on first start.
+
+    Later gaps are repaired by reconcile_purchases_job.py.
+    """
+    if purchases_collection.estimated_document_count() > 0:
+        return
+    reconcile_purchases(orders_collection, archived_orders_collection, purchases_collection)
+    print("Purchases collection backfilled from order history.")
+
+class _PendingWrite:
+    def __init__(self, order):
+        self.order = order
+        self.error = None
+        self.done = threading.Event()
+
+class OrderWriter:
+    """Group-commits concurrent order inserts into one insert_many per batch window.
+
+    Each caller of write() blocks until the batch holding its order has been
+    acknowledged with the configured write concern, so a response is never
+    sent for an order that is not yet durable.
+    """
+    def __init__(self, collection, window_ms, max_batch, on_committed=None):
+        self.collection = collection
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.on_committed = on_committed
+        self._queue = queue.Queue()
+        self._flusher = PerProcess(lambda: start_thread(self._run, "order-writer"))
+
+    def write(self, order):
+        if self.window <= 0:
+            self.collection.insert_one(order)
+            self._notify_committed([order])
+            return
+        self._flusher.get()
+        pending = _PendingWrite(order)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error:
+            raise pending.error
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        failed = {}
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') not in ['seller', 'admin']: 
-                return jsonify({'message': 'This action requires a seller or admin account!'}), 403
-            kwargs['current_user'] = data
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
-def buyer_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
+            self.collection.insert_many([pending.order for pending in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {err['index']: e for err in e.details.get('writeErrors', [])}
+            if e.details.get('writeConcernErrors'):
+                # Written but not acknowledged: the payment is taken, so orders that are
+                # majority-committed anyway still count; the rest fail.
+                failed.update(self._unconfirmed(batch, failed, e))
+        except Exception as e:
+            failed = {i: e for i in range(len(batch))}
+
+        self._notify_committed([pending.order for i, pending in enumerate(batch) if i not in failed])
+        for i, pending in enumerate(batch):
+            pending.error = failed.get(i)
+            pending.done.set()
+
+    def _unconfirmed(self, batch, skip, error):
+        """Maps the index of every order in batch (outside skip) that is not majority-committed to error.
+
+        A plain read could see a write that is later rolled back; a majority
+        read only returns orders that can no longer be lost.
+        """
+        candidates = {pending.order['order_id']: i for i, pending in enumerate(batch) if i not in skip}
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') not in ['buyer', 'admin']: 
-                return jsonify({'message': 'This action requires a buyer or admin account!'}), 403
-            kwargs['current_user_id'] = data.get('sub')
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
+            majority = self.collection.with_options(read_concern=ReadConcern('majority'))
+            found = {order['order_id'] for order in majority.find(
+                {"order_id": {"$in": list(candidates)}}, {"_id": 0, "order_id": 1}
+            )}
+        except Exception as e:
+            print(f"!!! WARNING: Could not confirm which orders were committed. Error: {e}")
+            found = set()
+        return {i: error for order_id, i in candidates.items() if order_id not in found}
+
+    def _notify_committed(self, orders):
+        if not orders or not self.on_committed:
+            return
+        # Runs before the callers are released, so a checkout only succeeds once
+        # its purchases are recorded; reconcile_purchases_job.py repairs the rest.
+        for attempt in range(ORDER_HOOK_ATTEMPTS):
+            try:
+                self.on_committed(orders)
+                return
+            except Exception as e:
+                print(f"!!! WARNING: Post-commit hook failed for {len(orders)} orders (attempt {attempt + 1}). Error: {e}")
+                if attempt + 1 < ORDER_HOOK_ATTEMPTS:
+                    time.sleep(0.1 * 2 ** attempt)
+
+def order_write_concern():
+    """The WriteConcern set through ORDER_WRITE_CONCERN_W / ORDER_WRITE_JOURNAL, or None."""
+    options = {}
+    if ORDER_WRITE_CONCERN_W:
+        options['w'] = int(ORDER_WRITE_CONCERN_W) if ORDER_WRITE_CONCERN_W.isdigit() else ORDER_WRITE_CONCERN_W
+    if ORDER_WRITE_JOURNAL:
+        options['j'] = ORDER_WRITE_JOURNAL.lower() == 'true'
+    return WriteConcern(**options) if options else None
+
+order_writer = OrderWriter(
+    orders_collection.with_options(write_concern=order_write_concern()),
+    window_ms=ORDER_WRITE_BATCH_WINDOW_MS,
+    max_batch=ORDER_WRITE_MAX_BATCH,
+    on_committed=record_purchases
+)
 
 @app.route("/orders/create", methods=['POST', 'OPTIONS'])
 @buyer_required
 def create_order(current_user_id):
     user_id = current_user_id
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if not idempotency_key:
+        return place_order(user_id, str(uuid.uuid4()))[:2]
+    if len(idempotency_key) > 128:
+        return jsonify({"message": "Idempotency-Key must be at most 128 characters"}), 400
+
+    order_id = str(uuid.uuid5(ORDER_ID_NAMESPACE, f"{user_id}:{idempotency_key}"))
+    if order_exists(order_id):
+        # A retry of a checkout that already went through.
+        return jsonify({"message": "Order placed successfully", "order_id": order_id}), 201
+    try:
+        checkout_claims_collection.insert_one({"_id": order_id, "user_id": user_id, "created_at": datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        if order_exists(order_id):
+            return jsonify({"message": "Order placed successfully", "order_id": order_id}), 201
+        return jsonify({"message": "This checkout is still being processed. Please try again in a moment."}), 409
+
+    body, status, paid = place_order(user_id, order_id)
+    if status >= 400 and not paid:
+        # Nothing was charged, so the same key may be used again. Once paid, the claim
+        # stays until it expires: a retry would otherwise take the stock a second time.
+        checkout_claims_collection.delete_one({"_id": order_id})
+    return body, status
+
+def order_exists(order_id):
+    return orders_collection.find_one({"order_id": order_id}, {"_id": 0, "order_id": 1}) is not None
+
+def is_duplicate_key(error):
+    if isinstance(error, DuplicateKeyError):
+        return True
+    if isinstance(error, BulkWriteError):
+        return any(err.get('code') == DUPLICATE_KEY_ERROR for err in error.details.get('writeErrors', []))
+    return False
+
+def place_order(user_id, order_id):
+    """Runs one checkout. Returns (response, status, paid); paid is True once a charge may have gone through."""
     print(f"Attempting to create order for user: {user_id}")
 
     try:
-        cart_response = requests.get(f"{CART_SERVICE_URL}/cart/{user_id}", timeout=5)
+        cart_response = service_session.get(f"{CART_SERVICE_URL}/cart/{user_id}", timeout=5)
         cart_response.raise_for_status()
         cart_items = cart_response.json()
         if not cart_items:
-            return jsonify({"message": "Cart is empty"}), 400
+            return jsonify({"message": "Cart is empty"}), 400, False
     except requests.exceptions.RequestException as e:
-        return jsonify({"message": f"Could not fetch cart: {e}"}), 500
+        return jsonify({"message": f"Could not fetch cart: {e}"}), 500, False
 
     order_items = []
     total_price = 0
     product_owner_map = {}
     try:
         for item in cart_items:
-            product_response = requests.get(f"{PRODUCT_SERVICE_URL}/products/{item['product_id']}", timeout=5)
+            product_response = service_session.get(f"{PRODUCT_SERVICE_URL}/products/{item['product_id']}", timeout=5)
             product_response.raise_for_status()
             product = product_response.json()
             
@@ -111,12 +319,12 @@ def create_order(current_user_id):
             total_price += float(product['price']) * item['quantity']
             product_owner_map[product['id']] = product.get('owner_id')
     except requests.exceptions.RequestException as e:
-        return jsonify({"message": f"Could not fetch product details: {e}"}), 500
+        return jsonify({"message": f"Could not fetch product details: {e}"}), 500, False
 
     inventory_decreased_items = []
     try:
         for item in order_items:
-            inventory_response = requests.post(
+            inventory_response = service_session.post(
                 f"{INVENTORY_SERVICE_URL}/inventory/decrease",
                 json={"product_id": item['product_id'], "quantity": item['quantity']},
                 timeout=5
@@ -127,15 +335,18 @@ def create_order(current_user_id):
             
             inventory_decreased_items.append(item)
     except Exception as e:
-        return jsonify({"message": f"{e}"}), 400
+        return jsonify({"message": f"{e}"}), 400, False
 
     try:
-        payment_response = requests.post(
+        payment_response = service_session.post(
             f"{PAYMENT_SERVICE_URL}/payment/process",
             json={"user_id": user_id, "amount": total_price},
+            headers={"Idempotency-Key": order_id},
             timeout=10
         )
         
+        if payment_response.status_code == 409:
+            return jsonify({"message": "This checkout is still being processed. Please try again in a moment."}), 409, True
         if payment_response.status_code != 200:
             error_data = payment_response.json()
             raise Exception(error_data.get("error", "Payment failed"))
@@ -143,11 +354,11 @@ def create_order(current_user_id):
         payment_data = payment_response.json()
         transaction_id = payment_data['transaction_id']
     except Exception as e:
-        return jsonify({"message": f"Payment failed: {e}"}), 402
+        return jsonify({"message": f"Payment failed: {e}"}), 402, False
 
     try:
         new_order = {
-            "order_id": str(uuid.uuid4()),
+            "order_id": order_id,
             "user_id": user_id,
             "items": order_items,
             "total_price": total_price,
@@ -155,36 +366,34 @@ def create_order(current_user_id):
             "status": "completed",
             "created_at": datetime.now(timezone.utc)
         }
-        orders_collection.insert_one(new_order)
+        # The insert itself runs on the writer thread; this span is the wait for the group commit.
+        with trace_span("order_writer.write"):
+            order_writer.write(new_order)
     except Exception as e:
-        return jsonify({"message": "Could not save order"}), 500
+        # A concurrent duplicate of this keyed checkout saved the order first.
+        if not (is_duplicate_key(e) and order_exists(order_id)):
+            return jsonify({"message": "Could not save order"}), 500, True
 
     try:
-        requests.post(f"{CART_SERVICE_URL}/cart/{user_id}/clear", timeout=5)
+        service_session.post(f"{CART_SERVICE_URL}/cart/{user_id}/clear", timeout=5)
     except requests.exceptions.RequestException as e:
         print(f"!!! WARNING: Could not clear cart for user {user_id}. Error: {e}")
 
-    return jsonify({"message": "Order placed successfully", "order_id": new_order['order_id']}), 201
+    return jsonify({"message": "Order placed successfully", "order_id": new_order['order_id']}), 201, True
 
 @app.route("/orders/<string:user_id>", methods=['GET', 'OPTIONS'])
 @buyer_required
 def get_orders_for_user(user_id, **kwargs):
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
-        
     token_user_id = kwargs.get('current_user_id')
     
     if token_user_id != user_id:
         return jsonify({"message": "Forbidden: You are not authorized to view these orders"}), 403
     
-    orders = list(orders_collection.find({'user_id': user_id}, {'_id': 0}).sort('created_at', -1))
+    orders = find_orders({'user_id': user_id}, get_date_range_filter())
     return jsonify(orders)
 
 @app.route("/orders/check-purchase", methods=['POST', 'OPTIONS'])
 def check_purchase():
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
-        
     data = request.get_json()
     user_id = data.get('user_id')
     product_id = data.get('product_id')
@@ -192,19 +401,35 @@ def check_purchase():
     if not user_id or not product_id:
         return jsonify({"message": "User ID and Product ID are required"}), 400
 
-    order = orders_collection.find_one({
-        "user_id": user_id,
-        "items.product_id": product_id,
-        "status": "completed"
-    })
+    purchase = purchases_collection.find_one(
+        {"user_id": user_id, "product_id": product_id},
+        {"_id": 0, "product_id": 1}
+    )
     
-    return jsonify({"has_purchased": order is not None}), 200
+    return jsonify({"has_purchased": purchase is not None}), 200
+
+@app.route("/orders/check-purchases", methods=['POST', 'OPTIONS'])
+def check_purchases():
+    data = request.get_json()
+    user_id = data.get('user_id')
+    product_ids = data.get('product_ids')
+
+    if not user_id or not isinstance(product_ids, list):
+        return jsonify({"message": "User ID and a list of Product IDs are required"}), 400
+
+    purchased = {
+        p['product_id'] for p in purchases_collection.find(
+            {"user_id": user_id, "product_id": {"$in": product_ids}},
+            {"_id": 0, "product_id": 1}
+        )
+    }
+    return jsonify({"purchased": {product_id: product_id in purchased for product_id in product_ids}}), 200
 
 @app.route("/admin/orders", methods=['GET', 'OPTIONS'])
 @admin_required
 def get_all_orders():
     try:
-        orders = list(orders_collection.find({}, {'_id': 0}).sort('created_at', DESCENDING))
+        orders = find_orders({}, get_date_range_filter(), secondary=True)
         return jsonify(orders), 200
     except Exception as e:
         return jsonify({"message": "Error fetching all orders"}), 500
@@ -241,10 +466,7 @@ def get_admin_stats():
         if date_filter:
             match_query["created_at"] = date_filter
             
-        pipeline = [
-            {
-                "$match": match_query
-            },
+        stages = [
             {
                 "$group": {
                     "_id": None,
@@ -253,7 +475,7 @@ def get_admin_stats():
                 }
             }
         ]
-        stats = list(orders_collection.aggregate(pipeline))
+        stats = aggregate_orders(match_query, stages)
         
         if not stats:
             return jsonify({"totalRevenue": 0, "totalOrders": 0}), 200
@@ -270,8 +492,7 @@ def get_admin_stats():
 def get_seller_stats(current_user):
     seller_id = current_user.get('sub')
     try:
-        pipeline = [
-            {"$match": {"status": "completed", "items.owner_id": seller_id}},
+        stages = [
             {"$unwind": "$items"},
             {"$match": {"items.owner_id": seller_id}},
             {
@@ -282,7 +503,7 @@ def get_seller_stats(current_user):
                 }
             }
         ]
-        stats = list(orders_collection.aggregate(pipeline))
+        stats = aggregate_orders({"status": "completed", "items.owner_id": seller_id}, stages)
         
         if not stats:
             return jsonify({"totalRevenue": 0, "totalSales": 0}), 200
@@ -306,10 +527,7 @@ def get_revenue_over_time():
         else:
             match_query["created_at"] = {"$gte": datetime.now(timezone.utc) - timedelta(days=30)}
             
-        pipeline = [
-            {
-                "$match": match_query
-            },
+        stages = [
             {
                 "$group": {
                     "_id": {
@@ -327,7 +545,7 @@ def get_revenue_over_time():
                 }
             }
         ]
-        data = list(orders_collection.aggregate(pipeline))
+        data = aggregate_orders(match_query, stages)
         return jsonify(data), 200
     except Exception as e:
         return jsonify({"message": f"Error generating revenue report: {e}"}), 500
@@ -342,8 +560,7 @@ def get_top_products():
         if date_filter:
             match_query["created_at"] = date_filter
             
-        pipeline = [
-            {"$match": match_query},
+        stages = [
             {"$unwind": "$items"},
             {
                 "$group": {
@@ -363,16 +580,25 @@ def get_top_products():
                 }
             }
         ]
-        data = list(orders_collection.aggregate(pipeline))
+        data = aggregate_orders(match_query, stages)
         return jsonify(data), 200
     except Exception as e:
         return jsonify({"message": f"Error generating top products report: {e}"}), 500
 
-if __name__ == '__main__':
+def init_db():
     orders_collection.create_index('user_id')
     orders_collection.create_index('order_id', unique=True)
     orders_collection.create_index([('created_at', DESCENDING)])
     orders_collection.create_index("items.product_id")
     orders_collection.create_index("items.owner_id")
+    if 'user_id_1_items.product_id_1' in orders_collection.index_information():
+        orders_collection.drop_index('user_id_1_items.product_id_1')
+    purchases_collection.create_index([('user_id', ASCENDING), ('product_id', ASCENDING)], unique=True)
+    # Claims of checkouts that died midway expire, so their key can be used again.
+    checkout_claims_collection.create_index('created_at', expireAfterSeconds=CHECKOUT_CLAIM_TTL_SECONDS)
+    backfill_purchases()
     print("MongoDB order indexes checked/created.")
-    app.run(host='0.0.0.0', port=5005, debug=True)
\ No newline at end of file
+
+if __name__ == '__main__':
+    init_db()
+    app.run(host='0.0.0.0', port=5005, debug=True)
@@ -0,0 +1,163 @@
+# otp_outbox.py (Durable OTP email queue drained by background senders)
+
+import json
+import uuid
+import threading
+from datetime import datetime, timezone, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from pymongo import ASCENDING
+
+from common.process import PerProcess, start_thread
+
+OTP_EMAIL_SUBJECT = "Your E-Commerce Verification Code"
+OTP_EMAIL_TEXT = "Your one-time password is: %recipient.otp%\n\nThis code will expire in 5 minutes."
+
+
+class OtpOutbox:
+    """Queues OTP emails in a collection and delivers them from sender threads.
+
+    enqueue() only writes the outbox entry, so request handlers never wait on
+    the mail provider. Senders claim pending entries in batches and send each
+    batch as one Mailgun batch message (one recipient variable per address).
+    Failed batches are retried with exponential backoff up to max_attempts.
+    An empty outbox is polled less and less often, up to max_poll_interval;
+    enqueue() wakes this process's senders immediately.
+    """
+
+    def __init__(self, collection, api_base, domain, api_key, sender,
+                 senders=2, batch_size=50, max_attempts=5, otp_ttl=timedelta(minutes=5)):
+        self.collection = collection
+        self.url = f"{api_base.rstrip('/')}/v3/{domain}/messages"
+        self.auth = ("api", api_key)
+        self.sender = sender
+        self.senders = senders
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.otp_ttl = otp_ttl
+        self.lease = timedelta(seconds=60)
+        self.poll_interval = 1.0
+        self.max_poll_interval = 30.0
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=senders))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=senders))
+        self._wakeup = threading.Event()
+        self._senders = PerProcess(lambda: [start_thread(self._sender_loop, f"otp-sender-{i}") for i in range(self.senders)])
+
+    def ensure_indexes(self):
+        self.collection.create_index([('status', ASCENDING), ('next_attempt_at', ASCENDING)])
+        self.collection.create_index('claim')
+        self.collection.create_index('created_at', expireAfterSeconds=86400)
+
+    def enqueue(self, recipient_email, otp):
+        if not recipient_email:
+            return False
+        now = datetime.now(timezone.utc)
+        self.collection.insert_one({
+            "to": recipient_email,
+            "otp": otp,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "expires_at": now + self.otp_ttl,
+            "created_at": now
+        })
+        self.start()
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        # Once per process: serve.py starts them in every worker, enqueue() covers the dev server.
+        self._senders.get()
+
+    def _sender_loop(self):
+        idle_wait = self.poll_interval
+        while True:
+            try:
+                batch = self._claim_batch()
+                if batch:
+                    self._deliver(batch)
+                    idle_wait = self.poll_interval
+                    continue
+            except Exception as e:
+                print(f"!!! WARNING: OTP sender error: {e}")
+            if self._wakeup.wait(idle_wait):
+                idle_wait = self.poll_interval
+            else:
+                idle_wait = min(idle_wait * 2, self.max_poll_interval)
+            self._wakeup.clear()
+
+    def _claimable(self, now):
+        return {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "lease_until": {"$lt": now}}
+        ]}
+
+    def _claim_batch(self):
+        now = datetime.now(timezone.utc)
+        ids = [entry['_id'] for entry in self.collection.find(self._claimable(now), {"_id": 1}).limit(self.batch_size)]
+        if not ids:
+            return []
+        claim = uuid.uuid4().hex
+        self.collection.update_many(
+            {"_id": {"$in": ids}, **self._claimable(now)},
+            {"$set": {"status": "sending", "claim": claim, "lease_until": now + self.lease}}
+        )
+        return list(self.collection.find({"claim": claim}))
+
+    def _deliver(self, batch):
+        now = datetime.now(timezone.utc)
+        expired = [entry['_id'] for entry in batch if entry['expires_at'].replace(tzinfo=timezone.utc) <= now]
+        if expired:
+            self._mark(expired, "expired")
+
+        # Only the newest code per address is still useful, and Mailgun allows one variable set per recipient.
+        latest = {}
+        for entry in sorted(batch, key=lambda entry: entry['created_at']):
+            if entry['_id'] not in expired:
+                latest[entry['to']] = entry
+        superseded = [entry['_id'] for entry in batch if entry['_id'] not in expired and latest[entry['to']] is not entry]
+        if superseded:
+            self._mark(superseded, "superseded")
+        if not latest:
+            return
+
+        entries = list(latest.values())
+        try:
+            response = self.session.post(
+                self.url,
+                auth=self.auth,
+                data={
+                    "from": self.sender,
+                    "to": list(latest),
+                    "subject": OTP_EMAIL_SUBJECT,
+                    "text": OTP_EMAIL_TEXT,
+                    "recipient-variables": json.dumps({address: {"otp": entry['otp']} for address, entry in latest.items()})
+                },
+                timeout=10
+            )
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+
+        if error is None:
+            self._mark([entry['_id'] for entry in entries], "sent")
+            print(f"OTP email sent to {len(entries)} recipients via Mailgun.")
+            return
+
+        print(f"Failed to send {len(entries)} OTP emails via Mailgun: {error}")
+        for entry in entries:
+            attempts = entry.get('attempts', 0) + 1
+            if attempts >= self.max_attempts:
+                update = {"status": "failed", "attempts": attempts, "last_error": error}
+            else:
+                backoff = timedelta(seconds=min(2 ** attempts, 60))
+                update = {"status": "pending", "attempts": attempts, "last_error": error, "next_attempt_at": now + backoff}
+            self.collection.update_one({"_id": entry['_id']}, {"$set": update, "$unset": {"claim": "", "lease_until": ""}})
+
+    def _mark(self, ids, status):
+        self.collection.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"status": status, "finished_at": datetime.now(timezone.utc)}, "$unset": {"claim": "", "lease_until": ""}}
+        )
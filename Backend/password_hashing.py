@@ -0,0 +1,78 @@
+# password_hashing.py (Runs user_services password hashing in a process pool)
+
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from common.process import PerProcess
+
+HASH_ALGORITHM = 'pbkdf2:sha256'
+DEFAULT_TARGET_MS = 300
+# Never below what a plain 'pbkdf2:sha256' hash gets from werkzeug, which is what older accounts use.
+DEFAULT_MIN_ITERATIONS = DEFAULT_PBKDF2_ITERATIONS
+
+
+class HashingBusy(Exception):
+    """Raised when too many hashes are already queued; callers should retry later."""
+
+
+def calibrate_iterations(target_ms, min_iterations, sample_iterations=100000, rounds=3):
+    """Picks the PBKDF2 iteration count that takes about target_ms on this machine.
+
+    Uses the fastest of a few samples, so a busy moment doesn't lower the count.
+    """
+    elapsed = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        generate_password_hash('calibration', method=f'{HASH_ALGORITHM}:{sample_iterations}')
+        elapsed = min(elapsed, time.perf_counter() - started)
+    iterations = int(sample_iterations * (target_ms / 1000) / elapsed)
+    return max(min_iterations, iterations // 1000 * 1000)
+
+
+def stored_iterations(stored_hash):
+    """Returns the iteration count of a werkzeug pbkdf2:sha256 hash, or None for other schemes."""
+    method = stored_hash.split('$', 1)[0].split(':')
+    if method[:2] != HASH_ALGORITHM.split(':') or len(method) != 3:
+        return None
+    try:
+        return int(method[2])
+    except ValueError:
+        return None
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in worker processes with bounded concurrency.
+
+    At most max_pending operations may be queued or running; further callers
+    wait up to wait_timeout seconds for a slot and then get HashingBusy, so a
+    login storm sheds load instead of piling up request threads.
+    """
+
+    def __init__(self, iterations, workers, max_pending, wait_timeout=2.0):
+        self.iterations = iterations
+        self.method = f'{HASH_ALGORITHM}:{iterations}'
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = PerProcess(lambda: ProcessPoolExecutor(max_workers=self.workers))
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        iterations = stored_iterations(stored_hash)
+        return iterations is None or iterations < self.iterations
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise HashingBusy()
+        try:
+            return self._executor.get().submit(fn, *args).result()
+        finally:
+            self._slots.release()
@@ -1,11 +1,27 @@
 import os
+
+# Served by gevent by default so a simulated delay only parks a greenlet, not a
+# worker. Patching has to happen before anything else imports socket/threading.
+PAYMENT_SERVER = os.environ.get('PAYMENT_SERVER', 'gevent')
+if __name__ == '__main__' and PAYMENT_SERVER == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import math
+import json
 import time
 import random
 import uuid
-from datetime import datetime, timezone
+import sqlite3
+import threading
+from datetime import datetime, timezone, timedelta
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
+from common.auth import admin_required, install_preflight_handler
+from common.metrics import install_metrics
+from common.tracing import install_tracing, trace_span
+from common.json_provider import install_json_provider
 
 # Load environment variables
 load_dotenv()
@@ -13,46 +29,158 @@ load_dotenv()
 app = Flask(__name__)
 # Enable CORS to match your other services
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
 
-@app.route("/payment/process", methods=['POST', 'OPTIONS'])
-def process_payment():
-    """
-    Simulates processing a payment.
-    Expected JSON payload: { "user_id": "jhondoe", "amount": 99.99 }
-    """
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
+LATENCY_PROFILES = ['fixed', 'uniform', 'lognormal']
+PAYMENT_LEDGER_PATH = os.environ.get('PAYMENT_LEDGER_PATH', 'payment_ledger.db')
+PAYMENT_BATCH_MAX_SIZE = int(os.environ.get('PAYMENT_BATCH_MAX_SIZE', 500))
+# A claim without a result after this long belongs to a process that died mid-payment.
+PAYMENT_CLAIM_LEASE_SECONDS = float(os.environ.get('PAYMENT_CLAIM_LEASE_SECONDS', 60))
+SECRET_KEY = os.environ.get('SECRET_KEY')
 
-    data = request.get_json()
-    user_id = data.get('user_id')
-    amount = data.get('amount')
+if not SECRET_KEY:
+    raise RuntimeError("SECRET_KEY not found in .env file")
 
-    # Basic validation
-    if not user_id or amount is None:
-        return jsonify({"message": "Invalid payment data. user_id and amount are required."}), 400
+# Simulation settings. Read from env at startup and adjustable at runtime via /payment/config.
+payment_config = {
+    "latency_profile": os.environ.get('PAYMENT_LATENCY_PROFILE', 'uniform'),
+    "latency_ms": float(os.environ.get('PAYMENT_LATENCY_MS', 1000)),          # fixed value / lognormal median
+    "latency_min_ms": float(os.environ.get('PAYMENT_LATENCY_MIN_MS', 500)),   # uniform lower bound
+    "latency_max_ms": float(os.environ.get('PAYMENT_LATENCY_MAX_MS', 2000)),  # uniform upper bound
+    "latency_sigma": float(os.environ.get('PAYMENT_LATENCY_SIGMA', 0.5)),     # lognormal spread
+    "spike_probability": float(os.environ.get('PAYMENT_SPIKE_PROBABILITY', 0)),
+    "spike_ms": float(os.environ.get('PAYMENT_SPIKE_MS', 5000)),
+    "failure_rate": float(os.environ.get('PAYMENT_FAILURE_RATE', 0.2)),
+    "seed": int(os.environ['PAYMENT_SEED']) if os.environ.get('PAYMENT_SEED') else None,
+}
+config_lock = threading.Lock()
+rng = random.Random(payment_config['seed'])
 
-    print(f"[{datetime.now()}] Processing payment of ${amount} for user '{user_id}'...")
+def validate_config(config):
+    if config['latency_profile'] not in LATENCY_PROFILES:
+        return f"latency_profile must be one of {LATENCY_PROFILES}"
+    if not 0 <= config['failure_rate'] <= 1 or not 0 <= config['spike_probability'] <= 1:
+        return "failure_rate and spike_probability must be between 0 and 1"
+    if min(config['latency_ms'], config['latency_min_ms'], config['latency_sigma'], config['spike_ms']) < 0:
+        return "Latency settings must not be negative"
+    if config['latency_min_ms'] > config['latency_max_ms']:
+        return "latency_min_ms must not exceed latency_max_ms"
+    return None
 
-    # 1. Simulate network delay (0.5 to 2 seconds)
-    # This makes the frontend loading spinner appear, making it feel realistic.
-    time.sleep(random.uniform(0.5, 2.0))
+def sample_latency_seconds():
+    """Draws one simulated provider delay from the configured distribution."""
+    profile = payment_config['latency_profile']
+    if profile == 'fixed':
+        latency_ms = payment_config['latency_ms']
+    elif profile == 'lognormal':
+        latency_ms = rng.lognormvariate(math.log(max(payment_config['latency_ms'], 1)), payment_config['latency_sigma'])
+    else:
+        latency_ms = rng.uniform(payment_config['latency_min_ms'], payment_config['latency_max_ms'])
+    if rng.random() < payment_config['spike_probability']:
+        latency_ms += payment_config['spike_ms']
+    return latency_ms / 1000
+
+# --- LEDGER ---
+# A payment writes a 'started' entry when it is claimed and a 'completed' entry
+# holding the response it returned. The unique index on (idempotency_key, event)
+# makes the claim atomic across workers. A 'started' entry older than the lease
+# with no 'completed' entry is re-claimed by moving its created_at forward.
+ledger_lock = threading.Lock()
+ledger = sqlite3.connect(PAYMENT_LEDGER_PATH, check_same_thread=False, isolation_level=None)
+ledger.execute("PRAGMA journal_mode=WAL")
+ledger.execute("PRAGMA busy_timeout=5000")
+
+def ensure_ledger_schema():
+    # Runs on import in every worker, so the ledger exists even with serve.py --skip-init.
+    ledger.execute("""
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL,
+            event TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            http_status INTEGER,
+            response TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    ledger.execute("CREATE UNIQUE INDEX IF NOT EXISTS ledger_key_event ON ledger (idempotency_key, event)")
+
+ensure_ledger_schema()
+
+def init_db():
+    error = validate_config(payment_config)
+    if error:
+        raise RuntimeError(f"Invalid payment simulation settings: {error}")
+
+def claim_payment(idempotency_key, user_id, amount):
+    """Records the start of a payment. Returns True if this call owns it.
 
-    # 2. Random Success/Failure Logic
-    # 80% chance of success, 20% chance of failure
-    if random.random() < 0.8:
+    Also takes over a matching claim whose lease ran out before it completed.
+    """
+    now = datetime.now(timezone.utc)
+    with ledger_lock:
+        try:
+            ledger.execute(
+                "INSERT INTO ledger (idempotency_key, event, user_id, amount, created_at) VALUES (?, 'started', ?, ?, ?)",
+                (idempotency_key, user_id, amount, now.isoformat())
+            )
+            return True
+        except sqlite3.IntegrityError:
+            pass
+        # One statement, so two workers can't both take over the same stale claim.
+        taken_over = ledger.execute(
+            "UPDATE ledger SET created_at = ? WHERE idempotency_key = ? AND event = 'started'"
+            " AND user_id = ? AND amount = ? AND created_at < ?"
+            " AND NOT EXISTS (SELECT 1 FROM ledger WHERE idempotency_key = ? AND event = 'completed')",
+            (now.isoformat(), idempotency_key, user_id, amount,
+             (now - timedelta(seconds=PAYMENT_CLAIM_LEASE_SECONDS)).isoformat(), idempotency_key)
+        ).rowcount
+    if taken_over:
+        print(f"Re-claiming stale payment {idempotency_key} for user '{user_id}'")
+    return taken_over == 1
+
+def complete_payment(idempotency_key, user_id, amount, http_status, body):
+    with ledger_lock:
+        ledger.execute(
+            "INSERT INTO ledger (idempotency_key, event, user_id, amount, http_status, response, created_at) VALUES (?, 'completed', ?, ?, ?, ?, ?)",
+            (idempotency_key, user_id, amount, http_status, json.dumps(body), datetime.now(timezone.utc).isoformat())
+        )
+
+def previous_outcome(idempotency_key, user_id, amount):
+    """Returns the (http_status, body) a duplicate request should receive."""
+    with ledger_lock:
+        rows = ledger.execute(
+            "SELECT event, user_id, amount, http_status, response FROM ledger WHERE idempotency_key = ?",
+            (idempotency_key,)
+        ).fetchall()
+    entries = {event: (row_user, row_amount, http_status, response) for event, row_user, row_amount, http_status, response in rows}
+    started_user, started_amount = entries['started'][:2]
+    if started_user != user_id or started_amount != amount:
+        return 422, {"message": "Idempotency key was already used for a different payment."}
+    if 'completed' not in entries:
+        return 409, {"message": "A payment with this idempotency key is still being processed."}
+    return entries['completed'][2], json.loads(entries['completed'][3])
+
+def decide_payment(amount):
+    """Applies the configured success/failure odds to one payment."""
+    if rng.random() >= payment_config['failure_rate']:
         # --- SUCCESS CASE ---
         transaction_id = f"txn_{uuid.uuid4().hex}"
         print(f"✅ Payment SUCCESS: {transaction_id}")
-        return jsonify({
+        return 200, {
             "status": "SUCCESS",
             "message": "Payment processed successfully",
             "transaction_id": transaction_id,
             "amount": amount,
             "timestamp": datetime.now(timezone.utc).isoformat()
-        }), 200
+        }
     else:
         # --- FAILURE CASE ---
-        error_reason = random.choice([
+        error_reason = rng.choice([
             "insufficient_funds",
             "card_declined",
             "incorrect_cvc",
@@ -61,14 +189,124 @@ def process_payment():
         ])
         print(f"❌ Payment FAILED: {error_reason}")
         # 402 Payment Required is the standard HTTP codeSJ for failed payments
-        return jsonify({
+        return 402, {
             "status": "FAILED",
             "message": "Payment could not be processed",
             "error": error_reason,
             "timestamp": datetime.now(timezone.utc).isoformat()
-        }), 402
+        }
+
+def validate_payment(payment):
+    if not isinstance(payment, dict):
+        return None, None, "Invalid payment data. Each payment must be an object."
+    user_id = payment.get('user_id')
+    amount = payment.get('amount')
+    if not user_id or amount is None:
+        return None, None, "Invalid payment data. user_id and amount are required."
+    try:
+        return user_id, float(amount), None
+    except (TypeError, ValueError):
+        return None, None, "Invalid payment data. amount must be a number."
+
+def settle_payment(idempotency_key, user_id, amount, simulate_delay=True):
+    """Processes one payment at most once per idempotency key."""
+    if not claim_payment(idempotency_key, user_id, amount):
+        return previous_outcome(idempotency_key, user_id, amount)
+
+    print(f"[{datetime.now()}] Processing payment of ${amount} for user '{user_id}'...")
+    try:
+        if simulate_delay:
+            # Simulate network delay from the configured latency profile.
+            # Under gevent this only suspends the current greenlet.
+            with trace_span("simulated provider latency"):
+                time.sleep(sample_latency_seconds())
+        http_status, body = decide_payment(amount)
+    except Exception as e:
+        http_status, body = 500, {"status": "FAILED", "message": f"Payment processing error: {e}"}
+    body = {**body, "idempotency_key": idempotency_key}
+    complete_payment(idempotency_key, user_id, amount, http_status, body)
+    return http_status, body
+
+# --- ENDPOINTS ---
+@app.route("/payment/process", methods=['POST', 'OPTIONS'])
+def process_payment():
+    """
+    Simulates processing a payment.
+    Expected JSON payload: { "user_id": "jhondoe", "amount": 99.99 }
+    Send an Idempotency-Key header (or "idempotency_key" field) to make retries safe.
+    """
+    data = request.get_json()
+    user_id, amount, error = validate_payment(data)
+    if error:
+        return jsonify({"message": error}), 400
+
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key') or str(uuid.uuid4())
+    http_status, body = settle_payment(idempotency_key, user_id, amount)
+    return jsonify(body), http_status
+
+@app.route("/payment/batch", methods=['POST', 'OPTIONS'])
+def process_payment_batch():
+    """
+    Authorizes many payments in one call, paying the simulated provider delay once.
+    Expected JSON payload: { "payments": [{ "idempotency_key": "...", "user_id": "...", "amount": 9.99 }, ...] }
+    """
+    payments = (request.get_json() or {}).get('payments')
+    if not isinstance(payments, list) or not payments:
+        return jsonify({"message": "A non-empty list of payments is required."}), 400
+    if len(payments) > PAYMENT_BATCH_MAX_SIZE:
+        return jsonify({"message": f"At most {PAYMENT_BATCH_MAX_SIZE} payments per batch."}), 400
+    if not all(isinstance(payment, dict) for payment in payments):
+        return jsonify({"message": "Each payment must be an object."}), 400
+
+    time.sleep(sample_latency_seconds())
+    results = []
+    for payment in payments:
+        idempotency_key = payment.get('idempotency_key') or str(uuid.uuid4())
+        user_id, amount, error = validate_payment(payment)
+        if error:
+            http_status, body = 400, {"message": error}
+        else:
+            http_status, body = settle_payment(idempotency_key, user_id, amount, simulate_delay=False)
+        results.append({"idempotency_key": idempotency_key, "http_status": http_status, **body})
+    return jsonify({"results": results}), 200
+
+@app.route("/payment/config", methods=['GET', 'PUT', 'OPTIONS'])
+@admin_required
+def payment_settings():
+    """Reads or changes the simulation settings, e.g. to switch profiles between load-test runs."""
+    global rng
+    if request.method == 'GET':
+        return jsonify(payment_config), 200
+
+    data = request.get_json() or {}
+    unknown = set(data) - set(payment_config)
+    if unknown:
+        return jsonify({"message": f"Unknown settings: {sorted(unknown)}"}), 400
+    try:
+        updated = {**payment_config, **{
+            key: value if key in ('latency_profile', 'seed') else float(value)
+            for key, value in data.items()
+        }}
+        if updated['seed'] is not None:
+            updated['seed'] = int(updated['seed'])
+    except (TypeError, ValueError):
+        return jsonify({"message": "Settings must be numeric"}), 400
+    error = validate_config(updated)
+    if error:
+        return jsonify({"message": error}), 400
+
+    with config_lock:
+        payment_config.update(updated)
+        if 'seed' in data:
+            rng = random.Random(payment_config['seed'])
+    return jsonify(payment_config), 200
 
 if __name__ == '__main__':
+    init_db()
     # We use port 5007 because 5001-5006 are already taken by your other services.
-    print("gw Starting Mock Payment Service on port 5007...")
-    app.run(host='0.0.0.0', port=5007, debug=True)
\ No newline at end of file
+    print(f"gw Starting Mock Payment Service on port 5007 ({PAYMENT_SERVER} server, {payment_config['latency_profile']} latency)...")
+    if PAYMENT_SERVER == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', 5007), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=5007, debug=True)
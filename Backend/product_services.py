@@ -1,12 +1,14 @@
 # product_service.py (Updated with an Admin-only delete route)
 
 import os
-from pymongo import MongoClient
 from flask import Flask, jsonify, request # Make sure 'request' is imported
 from flask_cors import CORS
 from dotenv import load_dotenv
-import jwt
-from functools import wraps
+from common.auth import admin_required, require_roles, install_preflight_handler
+from common.mongo import create_client, secondary_reads
+from common.metrics import install_metrics
+from common.tracing import install_tracing
+from common.json_provider import install_json_provider
 import uuid
 
 # Load environment variables
@@ -16,6 +18,10 @@ load_dotenv()
 app = Flask(__name__)
 # Updated CORS origins to match your other services
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
 
 MONGO_URI = os.environ.get('PRODUCT_DB_URI')
 SECRET_KEY = os.environ.get('SECRET_KEY') # Needed to decode JWTs
@@ -23,65 +29,63 @@ SECRET_KEY = os.environ.get('SECRET_KEY') # Needed to decode JWTs
 if not MONGO_URI or not SECRET_KEY:
     raise RuntimeError("Database URI or SECRET_KEY not found in .env file")
 
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.product_db
 products_collection = db.products
+related_products_collection = db.related_products
+# Public catalog reads may be served by secondaries; seller writes stay on the primary.
+products_replica = secondary_reads(products_collection)
+related_products_replica = secondary_reads(related_products_collection)
+PRODUCTS_MAX_PAGE_SIZE = 200
 
-# 2. --- SECURITY DECORATORS (THE FIX IS HERE) ---
-def seller_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        # --- THIS IS THE FIX ---
-        # Allow all OPTIONS requests to pass through for CORS preflight
-        if request.method == 'OPTIONS':
-            return f(*args, **kwargs)
-        # --- END OF FIX ---
-            
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') != 'seller': return jsonify({'message': 'This action requires a seller account!'}), 403
-            return f(data.get('sub'), *args, **kwargs)
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-    return decorated
-
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        # --- THIS IS THE FIX ---
-        # Allow all OPTIONS requests to pass through for CORS preflight
-        if request.method == 'OPTIONS':
-            return f(*args, **kwargs)
-        # --- END OF FIX ---
-            
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') != 'admin': return jsonify({'message': 'This action requires an admin account!'}), 403
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
+# 2. --- SECURITY DECORATORS ---
+# Only sellers own products here, so admins don't pass and the view gets the username.
+seller_required = require_roles('seller', subject_kwarg='current_seller')
 
 # 3. --- API ENDPOINTS ---
 
 # --- Public Endpoints (No change needed) ---
 @app.route("/products", methods=['GET'])
 def get_products():
-    return jsonify(list(products_collection.find({}, {'_id': 0})))
+    """Lists products.
+
+    ?ids=P1,P2 returns just those products. ?limit=N (optionally with
+    &after=<last id>) returns one page ordered by id as {products, next_cursor};
+    without it the whole catalog is returned as a list, as before.
+    """
+    ids = request.args.get('ids')
+    if ids is not None:
+        product_ids = [product_id for product_id in ids.split(',') if product_id][:PRODUCTS_MAX_PAGE_SIZE]
+        return jsonify(list(products_replica.find({'id': {'$in': product_ids}}, {'_id': 0})))
+
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return jsonify(list(products_replica.find({}, {'_id': 0})))
+    limit = max(1, min(limit, PRODUCTS_MAX_PAGE_SIZE))
+    after = request.args.get('after')
+    query = {'id': {'$gt': after}} if after else {}
+    products = list(products_replica.find(query, {'_id': 0}).sort('id', 1).limit(limit + 1))
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = products[-1]['id']
+    return jsonify({"products": products, "next_cursor": next_cursor})
 
 @app.route("/products/<string:product_id>", methods=['GET'])
 def get_product(product_id):
-    product = products_collection.find_one({'id': product_id}, {'_id': 0})
+    product = products_replica.find_one({'id': product_id}, {'_id': 0})
     return jsonify(product) if product else (jsonify({"message": "Product not found"}), 404)
 
+@app.route("/products/<string:product_id>/related", methods=['GET'])
+def get_related_products(product_id):
+    """Returns products frequently bought together, precomputed by related_products_job.py."""
+    entry = related_products_replica.find_one({'product_id': product_id}, {'_id': 0, 'related': 1})
+    return jsonify(entry['related'] if entry else [])
+
 @app.route("/products/search", methods=['GET'])
 def search_products():
     query = request.args.get('q', '')
-    return jsonify(list(products_collection.find({'$text': {'$search': query}}, {'_id': 0})))
+    return jsonify(list(products_replica.find({'$text': {'$search': query}}, {'_id': 0})))
 
 # --- Seller-Only Endpoints (Added 'OPTIONS') ---
 @app.route("/products", methods=['POST', 'OPTIONS'])
@@ -127,10 +131,14 @@ def admin_delete_product(product_id):
     except Exception as e:
         return jsonify({'message': f'Could not delete product: {e}'}), 500
         
-# 4. --- RUN ---
-if __name__ == '__main__':
+def init_db():
     products_collection.create_index([('name', 'text'), ('description', 'text')])
     products_collection.create_index('id', unique=True)
     products_collection.create_index('owner_id')
+    related_products_collection.create_index('product_id', unique=True)
     print("MongoDB product indexes checked/created.")
-    app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
+
+# 4. --- RUN ---
+if __name__ == '__main__':
+    init_db()
+    app.run(host='0.0.0.0', port=5002, debug=True)
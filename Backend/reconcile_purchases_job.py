@@ -0,0 +1,71 @@
+# reconcile_purchases_job.py (Repairs the purchases collection from order history)
+
+import os
+import time
+import argparse
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ASCENDING
+from dotenv import load_dotenv
+from common.mongo import create_client
+
+load_dotenv()
+
+MONGO_URI = os.environ.get('ORDER_DB_URI')
+PURCHASES_RECONCILE_LOOKBACK_HOURS = int(os.environ.get('PURCHASES_RECONCILE_LOOKBACK_HOURS', 48))
+
+
+def reconcile_purchases(orders_collection, archived_orders_collection, purchases_collection, since=None):
+    """Merges every (user_id, product_id) bought in a completed order into purchases.
+
+    Existing entries are kept, so it only adds what a failed post-commit
+    upsert left out. With since, only orders created after it are scanned
+    (they are all still in the hot tier); without it, the archive too.
+    """
+    match = {"status": "completed"}
+    pipeline = [{"$match": match}]
+    if since is not None:
+        match["created_at"] = {"$gte": since}
+    else:
+        pipeline.append({"$unionWith": {"coll": archived_orders_collection.name, "pipeline": [{"$match": match}]}})
+    orders_collection.aggregate(pipeline + [
+        {"$unwind": "$items"},
+        {"$sort": {"created_at": ASCENDING}},
+        {
+            "$group": {
+                "_id": {"user_id": "$user_id", "product_id": "$items.product_id"},
+                "order_id": {"$first": "$order_id"},
+                "purchased_at": {"$first": "$created_at"}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "user_id": "$_id.user_id",
+                "product_id": "$_id.product_id",
+                "order_id": 1,
+                "purchased_at": 1
+            }
+        },
+        {"$merge": {"into": purchases_collection.name, "on": ["user_id", "product_id"], "whenMatched": "keepExisting"}}
+    ], allowDiskUse=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Add purchases missing from the purchases collection.")
+    parser.add_argument('--interval', type=int, default=0,
+                        help="Re-run every N seconds instead of exiting after one run.")
+    parser.add_argument('--full', action='store_true',
+                        help="Scan all order history, archive included, instead of the lookback window.")
+    args = parser.parse_args()
+
+    if not MONGO_URI:
+        raise RuntimeError("ORDER_DB_URI not found in .env file")
+    db = create_client(MONGO_URI).order_db
+    while True:
+        since = None if args.full else datetime.now(timezone.utc) - timedelta(hours=PURCHASES_RECONCILE_LOOKBACK_HOURS)
+        reconcile_purchases(db.orders, db.orders_archive, db.purchases, since=since)
+        print(f"Purchases reconciled with orders {'from all history' if since is None else f'since {since:%Y-%m-%d %H:%M}'}.")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
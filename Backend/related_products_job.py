@@ -0,0 +1,139 @@
+# related_products_job.py (Builds the "frequently bought together" index from order history)
+
+import os
+import time
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy import sparse
+from pymongo import ReplaceOne
+from dotenv import load_dotenv
+from common.mongo import create_client, secondary_reads
+
+load_dotenv()
+
+ORDER_DB_URI = os.environ.get('ORDER_DB_URI')
+PRODUCT_DB_URI = os.environ.get('PRODUCT_DB_URI')
+RELATED_TOP_N = int(os.environ.get('RELATED_TOP_N', 10))
+RELATED_CHUNK_SIZE = int(os.environ.get('RELATED_CHUNK_SIZE', 50000))
+RELATED_WRITE_BATCH = 1000
+
+if not ORDER_DB_URI or not PRODUCT_DB_URI:
+    raise RuntimeError("ORDER_DB_URI and PRODUCT_DB_URI must be set.")
+
+# The full scan of order history is the heaviest read we make, so keep it off the primary.
+orders_collection = secondary_reads(create_client(ORDER_DB_URI).order_db.orders)
+related_products_collection = create_client(PRODUCT_DB_URI).product_db.related_products
+
+
+def _accumulate(counts, rows, cols, n_orders, n_products):
+    """Adds the co-purchase counts of one chunk of orders to the running matrix.
+
+    The chunk is an (orders x products) 0/1 incidence matrix, so A.T @ A gives
+    how many orders in the chunk contain each pair of products.
+    """
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+        shape=(n_orders, n_products)
+    )
+    if counts.shape != (n_products, n_products):
+        counts.resize((n_products, n_products))
+    return (counts + (incidence.T @ incidence)).tocsr()
+
+
+def build_co_purchase_matrix(chunk_size=RELATED_CHUNK_SIZE):
+    """Scans completed orders in chunks and returns (product_ids, counts).
+
+    Memory is bounded by the number of distinct product pairs, not by the
+    number of orders, since only one chunk of orders is held at a time.
+    """
+    product_index = {}
+    counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+    rows, cols, n_orders = [], [], 0
+
+    cursor = orders_collection.find(
+        {"status": "completed"},
+        {"_id": 0, "items.product_id": 1}
+    ).batch_size(min(chunk_size, 10000))
+
+    for order in cursor:
+        product_ids = {item.get('product_id') for item in order.get('items', [])}
+        product_ids.discard(None)
+        if len(product_ids) < 2:
+            continue
+        for product_id in product_ids:
+            rows.append(n_orders)
+            cols.append(product_index.setdefault(product_id, len(product_index)))
+        n_orders += 1
+        if n_orders >= chunk_size:
+            counts = _accumulate(counts, rows, cols, n_orders, len(product_index))
+            rows, cols, n_orders = [], [], 0
+
+    if n_orders:
+        counts = _accumulate(counts, rows, cols, n_orders, len(product_index))
+
+    counts = counts.tolil()
+    counts.setdiag(0)
+    counts = counts.tocsr()
+    counts.eliminate_zeros()
+
+    product_ids = [None] * len(product_index)
+    for product_id, i in product_index.items():
+        product_ids[i] = product_id
+    return product_ids, counts
+
+
+def top_neighbours(counts, row, top_n):
+    """Returns [(column, count)] for the top_n largest entries of a CSR row."""
+    start, end = counts.indptr[row], counts.indptr[row + 1]
+    data = counts.data[start:end]
+    columns = counts.indices[start:end]
+    if len(data) > top_n:
+        keep = np.argpartition(-data, top_n - 1)[:top_n]
+        data, columns = data[keep], columns[keep]
+    order = np.argsort(-data, kind='stable')
+    return [(int(columns[i]), int(data[i])) for i in order]
+
+
+def run_job(top_n=RELATED_TOP_N, chunk_size=RELATED_CHUNK_SIZE):
+    started_at = datetime.now(timezone.utc)
+    product_ids, counts = build_co_purchase_matrix(chunk_size)
+
+    operations = []
+    for row, product_id in enumerate(product_ids):
+        related = [
+            {"product_id": product_ids[column], "count": count}
+            for column, count in top_neighbours(counts, row, top_n)
+        ]
+        if not related:
+            continue
+        operations.append(ReplaceOne(
+            {"product_id": product_id},
+            {"product_id": product_id, "related": related, "updated_at": started_at},
+            upsert=True
+        ))
+        if len(operations) >= RELATED_WRITE_BATCH:
+            related_products_collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        related_products_collection.bulk_write(operations, ordered=False)
+
+    # Products that no longer have any co-purchases keep a stale entry otherwise.
+    related_products_collection.delete_many({"updated_at": {"$lt": started_at}})
+    print(f"Related products index rebuilt for {len(product_ids)} products "
+          f"in {(datetime.now(timezone.utc) - started_at).total_seconds():.1f}s.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the frequently-bought-together index.")
+    parser.add_argument('--interval', type=int, default=0,
+                        help="Re-run every N seconds instead of exiting after one run.")
+    args = parser.parse_args()
+
+    related_products_collection.create_index('product_id', unique=True)
+    while True:
+        run_job()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient, DESCENDING, ASCENDING
+from pymongo import DESCENDING, ASCENDING, ReplaceOne, UpdateOne, ReturnDocument
 import json
 import uuid
 from flask import Flask, jsonify, request
@@ -7,112 +7,211 @@ from flask_cors import CORS
 import requests
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-import jwt
-from functools import wraps
+from common.auth import admin_required, seller_required, buyer_required, install_preflight_handler
+from common.cache import TTLCache
+from common.mongo import create_client, secondary_reads
+from common.http import create_session
+from common.metrics import metrics, install_metrics
+from common.tracing import install_tracing
+from common.json_provider import install_json_provider
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
 
 MONGO_URI = os.environ.get('REVIEW_DB_URI')
 ORDER_SERVICE_URL = "http://order_service:5005"
 SECRET_KEY = os.environ.get('SECRET_KEY')
+PURCHASE_CACHE_TTL = int(os.environ.get('PURCHASE_CACHE_TTL', 600))
+PURCHASE_CACHE_SIZE = int(os.environ.get('PURCHASE_CACHE_SIZE', 10000))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))
 
 if not MONGO_URI or not SECRET_KEY or not ORDER_SERVICE_URL:
     raise RuntimeError("Database URI, Secret Key, or Order Service URL not found")
 
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.review_db
 reviews_collection = db.reviews
+product_ratings_collection = db.product_ratings
+# Public listings and averages may lag a moment behind moderation, so they read from secondaries.
+reviews_replica = secondary_reads(reviews_collection)
+product_ratings_replica = secondary_reads(product_ratings_collection)
+STAR_VALUES = range(1, 6)
+REVIEWS_PAGE_SIZE = 20
+REVIEWS_MAX_PAGE_SIZE = 100
+# The BFF asks for one product page at a time, which is at most 100 products.
+AVERAGES_MAX_PRODUCT_IDS = 100
 
-def buyer_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') not in ['buyer', 'admin']: 
-                return jsonify({'message': 'This action requires a buyer or admin account!'}), 403
-            kwargs['current_user_id'] = data.get('sub')
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
-def seller_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') not in ['seller', 'admin']: 
-                return jsonify({'message': 'This action requires a seller or admin account!'}), 403
-            kwargs['current_user'] = data
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            return jsonify({}), 200
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') != 'admin': 
-                return jsonify({'message': 'This action requires an admin account!'}), 403
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
+# Purchases are never undone, so a positive verdict stays valid; negatives are
+# not cached because they flip as soon as the user buys the product.
+purchase_cache = TTLCache(max_size=PURCHASE_CACHE_SIZE, ttl=PURCHASE_CACHE_TTL)
+metrics.register_cache('purchase', purchase_cache)
+order_service_session = create_session(HTTP_POOL_SIZE)
+
+def verify_purchase(user_id, product_id):
+    """Asks the order service whether the user bought the product.
+
+    Returns True/False, or None when the order service answered with an error.
+    Raises requests.exceptions.RequestException when it could not be reached.
+    """
+    if purchase_cache.get((user_id, product_id)):
+        return True
+    response = order_service_session.post(
+        f"{ORDER_SERVICE_URL}/orders/check-purchase",
+        json={"user_id": user_id, "product_id": product_id},
+        timeout=5
+    )
+    if not response.ok:
+        return None
+    has_purchased = bool(response.json().get('has_purchased'))
+    if has_purchased:
+        purchase_cache.set((user_id, product_id), True)
+    return has_purchased
+
+def rating_summary(product_id, aggregate):
+    """Turns a product_ratings document (or None) into the public rating payload."""
+    aggregate = aggregate or {}
+    count = aggregate.get('count', 0)
+    histogram = aggregate.get('histogram', {})
+    return {
+        "product_id": product_id,
+        "averageRating": aggregate.get('sum', 0) / count if count > 0 else 0,
+        "reviewCount": count,
+        "histogram": {str(star): histogram.get(str(star), 0) for star in STAR_VALUES}
+    }
+
+def approval_delta(old_status, new_status):
+    """+1 when a review enters 'approved', -1 when it leaves it, 0 otherwise."""
+    return int(new_status == 'approved') - int(old_status == 'approved')
+
+def rating_increment(rating, delta):
+    return {"$inc": {"count": delta, "sum": delta * rating, f"histogram.{rating}": delta}}
+
+def get_page_limit():
+    limit = request.args.get('limit', REVIEWS_PAGE_SIZE, type=int)
+    return max(1, min(limit, REVIEWS_MAX_PAGE_SIZE))
+
+def paginate_reviews(query, cursor=None, sort_by_rating=False, ascending=False, limit=REVIEWS_PAGE_SIZE, collection=None):
+    """Returns one keyset page of reviews plus the cursor for the next page.
+
+    Pages are ordered by created_at (or by rating, then created_at), with
+    review_id breaking ties, and the cursor encodes the sort key of the last
+    review returned, so every page is a bounded range scan on a compound index
+    instead of a skip or in-memory sort.
+    Reads go to the primary unless another collection view is passed in.
+    """
+    direction = ASCENDING if ascending else DESCENDING
+    past = '$gt' if ascending else '$lt'
+    fields = ['rating', 'created_at', 'review_id'] if sort_by_rating else ['created_at', 'review_id']
+    sort = [(field, direction) for field in fields]
+
+    if cursor:
+        parts = cursor.split('|')
+        if len(parts) != len(fields):
+            raise ValueError("Invalid pagination cursor")
+        values = [int(parts[0]), datetime.fromisoformat(parts[1]), parts[2]] if sort_by_rating \
+            else [datetime.fromisoformat(parts[0]), parts[1]]
+        # Everything strictly past the last key: equal on a prefix of the fields, past it on the next one.
+        query = {**query, "$or": [
+            {**dict(zip(fields[:i], values[:i])), fields[i]: {past: values[i]}}
+            for i in range(len(fields))
+        ]}
+
+    reviews = list((collection or reviews_collection).find(query, {"_id": 0}).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        last = reviews[-1]
+        next_cursor = f"{last['created_at'].isoformat()}|{last['review_id']}"
+        if sort_by_rating:
+            next_cursor = f"{last['rating']}|{next_cursor}"
+    return {"reviews": reviews, "next_cursor": next_cursor}
+
+def rebuild_product_ratings(product_ids=None):
+    """Recomputes product_ratings documents from the approved reviews.
+
+    Rebuilds every product by default, or only the given product_ids.
+    """
+    aggregates = {}
+    match = {"status": "approved"}
+    if product_ids is not None:
+        match["product_id"] = {"$in": list(product_ids)}
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {"product_id": "$product_id", "rating": "$rating"}, "count": {"$sum": 1}}}
+    ]
+    for row in reviews_collection.aggregate(pipeline, allowDiskUse=True):
+        product_id, rating = row['_id']['product_id'], row['_id']['rating']
+        aggregate = aggregates.setdefault(product_id, {"product_id": product_id, "count": 0, "sum": 0, "histogram": {}})
+        aggregate['count'] += row['count']
+        aggregate['sum'] += rating * row['count']
+        aggregate['histogram'][str(rating)] = row['count']
+
+    if aggregates:
+        product_ratings_collection.bulk_write(
+            [ReplaceOne({"product_id": product_id}, aggregate, upsert=True) for product_id, aggregate in aggregates.items()],
+            ordered=False
+        )
+    stale = {"product_id": {"$nin": list(aggregates)}}
+    if product_ids is not None:
+        stale["product_id"]["$in"] = list(product_ids)
+    product_ratings_collection.delete_many(stale)
+    return len(aggregates)
 
 @app.route("/reviews/average/<string:product_id>", methods=['GET', 'OPTIONS'])
 def get_average_rating(product_id):
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
     try:
-        pipeline = [
-            {"$match": {"product_id": product_id, "status": "approved"}},
-            {"$group": {"_id": "$product_id", "averageRating": {"$avg": "$rating"}, "reviewCount": {"$sum": 1}}}
-        ]
-        result = list(reviews_collection.aggregate(pipeline))
-        if not result:
-            return jsonify({"product_id": product_id, "averageRating": 0, "reviewCount": 0}), 200
-        
-        result[0]['product_id'] = result[0].pop('_id')
-        return jsonify(result[0]), 200
+        aggregate = product_ratings_replica.find_one({"product_id": product_id}, {"_id": 0})
+        return jsonify(rating_summary(product_id, aggregate)), 200
     except Exception as e:
         return jsonify({"message": f"Error fetching average rating: {e}"}), 500
 
+@app.route("/reviews/averages", methods=['POST', 'OPTIONS'])
+def get_average_ratings():
+    data = request.get_json()
+    product_ids = data.get('product_ids')
+    if not isinstance(product_ids, list):
+        return jsonify({"message": "A list of Product IDs is required"}), 400
+    if len(product_ids) > AVERAGES_MAX_PRODUCT_IDS:
+        return jsonify({"message": f"At most {AVERAGES_MAX_PRODUCT_IDS} Product IDs may be requested at once"}), 400
+
+    try:
+        aggregates = {
+            aggregate['product_id']: aggregate for aggregate in
+            product_ratings_replica.find({"product_id": {"$in": product_ids}}, {"_id": 0})
+        }
+        averages = {}
+        for product_id in product_ids:
+            summary = rating_summary(product_id, aggregates.get(product_id))
+            averages[product_id] = {"averageRating": summary['averageRating'], "reviewCount": summary['reviewCount']}
+        return jsonify(averages), 200
+    except Exception as e:
+        return jsonify({"message": f"Error fetching average ratings: {e}"}), 500
+
 @app.route("/reviews/<string:product_id>", methods=['GET', 'OPTIONS'])
 def get_reviews_for_product(product_id):
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
     try:
-        reviews = list(reviews_collection.find(
-            {"product_id": product_id, "status": "approved"}, 
-            {"_id": 0}
-        ).sort('created_at', DESCENDING))
-        return jsonify(reviews), 200
+        page = paginate_reviews(
+            {"product_id": product_id, "status": "approved"},
+            cursor=request.args.get('before'),
+            sort_by_rating=request.args.get('sort') == 'rating',
+            limit=get_page_limit(),
+            collection=reviews_replica
+        )
+        return jsonify(page), 200
+    except ValueError:
+        return jsonify({"message": "Invalid pagination cursor"}), 400
     except Exception as e:
         return jsonify({"message": f"Error fetching reviews: {e}"}), 500
 
 @app.route("/reviews/check_eligibility", methods=['POST', 'OPTIONS'])
 @buyer_required
 def check_review_eligibility(current_user_id):
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
-    
     data = request.get_json()
     product_id = data.get('product_id')
     user_id = current_user_id
@@ -121,16 +220,12 @@ def check_review_eligibility(current_user_id):
         return jsonify({"message": "Product ID is required"}), 400
 
     try:
-        purchase_check_response = requests.post(
-            f"{ORDER_SERVICE_URL}/orders/check-purchase",
-            json={"user_id": user_id, "product_id": product_id},
-            timeout=5
-        )
+        has_purchased = verify_purchase(user_id, product_id)
         
-        if not purchase_check_response.ok:
+        if has_purchased is None:
              return jsonify({"eligible": False, "message": "Could not verify purchase."}), 200
 
-        if not purchase_check_response.json().get('has_purchased'):
+        if not has_purchased:
             return jsonify({"eligible": False, "message": "You can only review products you have purchased."}), 200
             
     except requests.exceptions.RequestException as e:
@@ -151,8 +246,6 @@ def check_review_eligibility(current_user_id):
 @app.route("/reviews/submit", methods=['POST', 'OPTIONS'])
 @buyer_required
 def submit_review(current_user_id):
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
     data = request.get_json()
     product_id = data.get('product_id')
     rating = data.get('rating')
@@ -161,14 +254,15 @@ def submit_review(current_user_id):
 
     if not all([product_id, rating, comment, user_id]):
         return jsonify({"message": "Product ID, rating, comment, and user ID are required"}), 400
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        rating = None
+    if rating not in STAR_VALUES:
+        return jsonify({"message": "Rating must be a whole number from 1 to 5"}), 400
 
     try:
-        purchase_check_response = requests.post(
-            f"{ORDER_SERVICE_URL}/orders/check-purchase",
-            json={"user_id": user_id, "product_id": product_id},
-            timeout=5
-        )
-        if not purchase_check_response.ok or not purchase_check_response.json().get('has_purchased'):
+        if not verify_purchase(user_id, product_id):
             return jsonify({"message": "You can only review products you have purchased"}), 403
     except requests.exceptions.RequestException as e:
         return jsonify({"message": f"Could not verify purchase: {e}"}), 500
@@ -185,7 +279,7 @@ def submit_review(current_user_id):
             "review_id": str(uuid.uuid4()),
             "user_id": user_id,
             "product_id": product_id,
-            "rating": int(rating),
+            "rating": rating,
             "comment": comment,
             "status": "pending",
             "created_at": datetime.now(timezone.utc)
@@ -199,20 +293,21 @@ def submit_review(current_user_id):
 @admin_required
 def get_pending_reviews():
     try:
-        reviews = list(reviews_collection.find(
-            {"status": "pending"}, 
-            {"_id": 0}
-        ).sort('created_at', ASCENDING))
-        return jsonify(reviews), 200
+        page = paginate_reviews(
+            {"status": "pending"},
+            cursor=request.args.get('after'),
+            ascending=True,
+            limit=get_page_limit()
+        )
+        return jsonify(page), 200
+    except ValueError:
+        return jsonify({"message": "Invalid pagination cursor"}), 400
     except Exception as e:
         return jsonify({"message": f"Error fetching pending reviews: {e}"}), 500
 
 @app.route("/admin/reviews/<string:review_id>/status", methods=['PUT', 'OPTIONS'])
 @admin_required
 def update_review_status(review_id):
-    if request.method == 'OPTIONS':
-            return jsonify({}), 200
-            
     data = request.get_json()
     new_status = data.get('status')
 
@@ -220,40 +315,155 @@ def update_review_status(review_id):
         return jsonify({"message": "Invalid status. Must be 'approved' or 'rejected'"}), 400
     
     try:
-        result = reviews_collection.update_one(
+        previous = reviews_collection.find_one_and_update(
             {"review_id": review_id},
-            {"$set": {"status": new_status}}
+            {"$set": {"status": new_status}},
+            projection={"_id": 0, "product_id": 1, "rating": 1, "status": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        if result.matched_count == 0:
+        if previous is None:
             return jsonify({"message": "Review not found"}), 404
+        delta = approval_delta(previous.get('status'), new_status)
+        if delta:
+            product_ratings_collection.update_one(
+                {"product_id": previous['product_id']},
+                rating_increment(previous['rating'], delta),
+                upsert=True
+            )
         return jsonify({"message": f"Review status updated to {new_status}"}), 200
     except Exception as e:
         return jsonify({"message": f"Error updating review status: {e}"}), 500
 
+@app.route("/admin/reviews/status", methods=['PUT', 'OPTIONS'])
+@admin_required
+def bulk_update_review_status():
+    data = request.get_json()
+    updates = data.get('updates')
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"message": "A non-empty list of {review_id, status} updates is required"}), 400
+
+    outcomes = {}
+    requested = {}
+    invalid = []   # positions in updates that are not {review_id, status} objects
+    for index, update in enumerate(updates):
+        review_id = update.get('review_id') if isinstance(update, dict) else None
+        if not review_id or not isinstance(review_id, str):
+            invalid.append(index)
+            continue
+        if update.get('status') not in ['approved', 'rejected']:
+            outcomes[review_id] = "invalid_status"
+            continue
+        requested[review_id] = update['status']
+
+    try:
+        existing = {
+            review['review_id']: review for review in reviews_collection.find(
+                {"review_id": {"$in": list(requested)}},
+                {"_id": 0, "review_id": 1, "product_id": 1, "rating": 1, "status": 1}
+            )
+        }
+
+        review_operations = []
+        rating_increments = {}
+        for review_id, new_status in requested.items():
+            review = existing.get(review_id)
+            if review is None:
+                outcomes[review_id] = "not_found"
+                continue
+            if review.get('status') == new_status:
+                outcomes[review_id] = "unchanged"
+                continue
+            # Guarding on the status we read keeps a concurrent change from being double counted.
+            review_operations.append(UpdateOne(
+                {"review_id": review_id, "status": review.get('status')},
+                {"$set": {"status": new_status}}
+            ))
+            delta = approval_delta(review.get('status'), new_status)
+            if delta:
+                increments = rating_increments.setdefault(review['product_id'], {})
+                for field, value in rating_increment(review['rating'], delta)["$inc"].items():
+                    increments[field] = increments.get(field, 0) + value
+            outcomes[review_id] = "updated"
+
+        if review_operations:
+            result = reviews_collection.bulk_write(review_operations, ordered=False)
+            if result.modified_count != len(review_operations):
+                # Some reviews changed under us; recount the affected products instead of guessing.
+                rebuild_product_ratings(rating_increments)
+                rating_increments = {}
+                # The bulk result doesn't say which guards failed, so re-read the reviews we tried.
+                attempted = [review_id for review_id, outcome in outcomes.items() if outcome == "updated"]
+                current = {
+                    review['review_id']: review.get('status') for review in reviews_collection.find(
+                        {"review_id": {"$in": attempted}}, {"_id": 0, "review_id": 1, "status": 1}
+                    )
+                }
+                for review_id in attempted:
+                    if review_id not in current:
+                        outcomes[review_id] = "not_found"
+                    elif current[review_id] != requested[review_id]:
+                        outcomes[review_id] = "conflict"
+        if rating_increments:
+            product_ratings_collection.bulk_write([
+                UpdateOne({"product_id": product_id}, {"$inc": increments}, upsert=True)
+                for product_id, increments in rating_increments.items()
+            ], ordered=False)
+
+        updated = sum(1 for outcome in outcomes.values() if outcome == "updated")
+        return jsonify({"message": f"{updated} reviews updated", "results": outcomes, "invalid": invalid}), 200
+    except Exception as e:
+        return jsonify({"message": f"Error updating review statuses: {e}"}), 500
+
+@app.route("/admin/reviews/ratings/rebuild", methods=['POST', 'OPTIONS'])
+@admin_required
+def rebuild_ratings():
+    try:
+        count = rebuild_product_ratings()
+        return jsonify({"message": f"Rating aggregates rebuilt for {count} products"}), 200
+    except Exception as e:
+        return jsonify({"message": f"Error rebuilding rating aggregates: {e}"}), 500
+
 @app.route("/seller/reviews", methods=['POST', 'OPTIONS'])
 @seller_required
 def get_seller_reviews(current_user):
-    if request.method == 'OPTIONS':
-        return jsonify({}), 200
-    
     data = request.get_json()
     product_ids = data.get('product_ids')
     if not product_ids:
-        return jsonify([]), 200
+        return jsonify({"reviews": [], "next_cursor": None}), 200
 
     try:
-        reviews = list(reviews_collection.find(
+        page = paginate_reviews(
             {"product_id": {"$in": product_ids}},
-            {"_id": 0}
-        ).sort('created_at', DESCENDING))
-        return jsonify(reviews), 200
+            cursor=request.args.get('before'),
+            limit=get_page_limit()
+        )
+        return jsonify(page), 200
+    except ValueError:
+        return jsonify({"message": "Invalid pagination cursor"}), 400
     except Exception as e:
         return jsonify({"message": f"Error fetching seller reviews: {e}"}), 500
 
-if __name__ == '__main__':
+def init_db():
     reviews_collection.create_index('review_id', unique=True)
     reviews_collection.create_index('product_id')
     reviews_collection.create_index('user_id')
     reviews_collection.create_index('status')
+    # The page indexes end in review_id, the tie-breaker of paginate_reviews(); the
+    # versions without it are dropped since these cover the same queries.
+    existing_indexes = reviews_collection.index_information()
+    for name in ['product_id_1_status_1_created_at_-1', 'product_id_1_status_1_rating_-1_created_at_-1',
+                 'product_id_1_created_at_-1', 'status_1_created_at_1']:
+        if name in existing_indexes:
+            reviews_collection.drop_index(name)
+    reviews_collection.create_index([('product_id', ASCENDING), ('status', ASCENDING), ('created_at', DESCENDING), ('review_id', DESCENDING)])
+    reviews_collection.create_index([('product_id', ASCENDING), ('status', ASCENDING), ('rating', DESCENDING), ('created_at', DESCENDING), ('review_id', DESCENDING)])
+    reviews_collection.create_index([('product_id', ASCENDING), ('created_at', DESCENDING), ('review_id', DESCENDING)])
+    reviews_collection.create_index([('status', ASCENDING), ('created_at', ASCENDING), ('review_id', ASCENDING)])
+    product_ratings_collection.create_index('product_id', unique=True)
+    if product_ratings_collection.estimated_document_count() == 0:
+        rebuild_product_ratings()
     print("MongoDB review indexes checked/created.")
-    app.run(host='0.0.0.0', port=5008, debug=True)
\ No newline at end of file
+
+if __name__ == '__main__':
+    init_db()
+    app.run(host='0.0.0.0', port=5008, debug=True)
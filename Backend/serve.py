@@ -0,0 +1,201 @@
+# serve.py (Runs a backend service under gunicorn instead of the Flask dev server)
+#
+# Usage: python serve.py order_service
+#
+# `python <service>.py` still starts the single-process dev server with the
+# debugger on. This launcher is the production mode used by docker-compose.
+#
+# Settings (env):
+#   WEB_WORKER_CLASS        sync | gthread | gevent (default depends on the service)
+#   WEB_WORKERS             worker processes (default: 2 * CPUs + 1 for sync/gthread, CPUs for gevent;
+#                           CPUs for user_service, 1 for payment_service)
+#   WEB_THREADS             threads per gthread worker (default 4)
+#   WEB_WORKER_CONNECTIONS  concurrent requests per gevent worker (default 1000)
+#   WEB_TIMEOUT             seconds before a stuck worker is restarted (default 30)
+#   WEB_KEEPALIVE           seconds to hold idle keep-alive connections (default 5)
+#   WEB_ACCESS_LOG          set to "-" to log every request to stdout
+#   METRICS_DIR             where workers share /metrics totals, one subdirectory per service (default: temp dir)
+# With more than one worker, user_service defaults CAPTCHA_STORE to mongo and
+# RATELIMIT_STORAGE_URI to USER_DB_URI, and refuses to start with per-process stores.
+# user_service's hashing and CAPTCHA pools are per worker; see size_process_pools().
+# PASSWORD_HASH_ITERATIONS, when unset, is calibrated once here and shared by all workers.
+# Connection pools are sized per worker with MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE
+# and HTTP_POOL_SIZE (outbound calls in order_service, review_service and bff_service).
+
+import os
+import sys
+import glob
+import tempfile
+import argparse
+import importlib
+import subprocess
+
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+
+load_dotenv()
+
+# name -> (module, port, default worker class). Services that mostly wait on
+# other services or on a simulated provider default to gevent; user_service
+# stays on sync workers because hashing and CAPTCHA rendering use process pools.
+SERVICES = {
+    "user_service": ("user_services", 5001, "sync"),
+    "product_service": ("product_services", 5002, "sync"),
+    "inventory_service": ("inventory_services", 5003, "sync"),
+    "cart_service": ("cart_services", 5004, "sync"),
+    "order_service": ("order_services", 5005, "gevent"),
+    "wishlist_service": ("wishlist_service", 5006, "sync"),
+    "payment_service": ("payment_service", 5007, "gevent"),
+    "review_service": ("review_service", 5008, "gevent"),
+    "bff_service": ("bff_service", 5009, "gevent"),
+}
+WORKER_CLASSES = ["sync", "gthread", "gevent"]
+
+
+class ServiceApplication(BaseApplication):
+    """Gunicorn application that imports the service module in each worker.
+
+    The app is not preloaded: every worker imports the module after the fork,
+    so it gets its own MongoClient and background threads, and the gevent
+    worker has already monkey-patched the standard library by then. A module
+    may define start_background_tasks(), which every worker calls on load.
+    """
+
+    def __init__(self, module_name, options):
+        self.module_name = module_name
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        module = importlib.import_module(self.module_name)
+        if hasattr(module, 'start_background_tasks'):
+            module.start_background_tasks()
+        return module.app
+
+
+def default_workers(service, worker_class):
+    cpus = os.cpu_count() or 1
+    if service == "user_service":
+        # Every worker brings its own hashing and CAPTCHA process pools.
+        return cpus
+    if service == "payment_service":
+        # PUT /payment/config and the PAYMENT_SEED generator live in the worker's
+        # memory; one gevent worker keeps them consistent and has plenty of headroom.
+        return 1
+    return cpus if worker_class == "gevent" else cpus * 2 + 1
+
+
+def gunicorn_options(service, port, worker_class):
+    options = {
+        "bind": f"0.0.0.0:{port}",
+        "worker_class": worker_class,
+        "workers": int(os.environ.get('WEB_WORKERS', 0)) or default_workers(service, worker_class),
+        "timeout": int(os.environ.get('WEB_TIMEOUT', 30)),
+        "keepalive": int(os.environ.get('WEB_KEEPALIVE', 5)),
+        "accesslog": os.environ.get('WEB_ACCESS_LOG') or None,
+        "proc_name": f"microshop-{port}",
+    }
+    if worker_class == "gthread":
+        options["threads"] = int(os.environ.get('WEB_THREADS', 4))
+    if worker_class == "gevent":
+        options["worker_connections"] = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+    return options
+
+
+def use_shared_stores(service, workers):
+    """Moves user_service's CAPTCHA answers and rate-limit counters into Mongo.
+
+    Both live in process memory by default, which is only correct with one
+    worker: an answer issued by one worker would be rejected by the next, and
+    every worker would enforce the per-IP limits on its own.
+    """
+    if service != "user_service" or workers <= 1:
+        return
+    os.environ.setdefault('CAPTCHA_STORE', 'mongo')
+    os.environ.setdefault('RATELIMIT_STORAGE_URI', os.environ.get('USER_DB_URI', ''))
+    if os.environ['CAPTCHA_STORE'] != 'mongo' or os.environ['RATELIMIT_STORAGE_URI'].startswith('memory://'):
+        raise SystemExit("user_service with more than one worker needs CAPTCHA_STORE=mongo and a shared "
+                         "RATELIMIT_STORAGE_URI; set WEB_WORKERS=1 to keep the in-memory stores")
+
+
+def size_process_pools(service, workers):
+    """Splits user_service's hashing and CAPTCHA pools between its workers.
+
+    Each worker starts its own pools, so the machine runs WEB_WORKERS times
+    PASSWORD_HASH_WORKERS hashing processes and WEB_WORKERS times
+    CAPTCHA_POOL_WORKERS render processes, and keeps WEB_WORKERS times
+    CAPTCHA_POOL_SIZE challenges ready. Unset values default to a share of
+    the CPUs and of the single-process pool of 200; set values are per worker.
+    """
+    if service != "user_service":
+        return
+    cpus = os.cpu_count() or 1
+    hash_workers = int(os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(1, cpus // workers))))
+    render_workers = int(os.environ.get('CAPTCHA_POOL_WORKERS', 1))
+    pool_size = int(os.environ.setdefault('CAPTCHA_POOL_SIZE', str(max(20, 200 // workers))))
+    print(f"user_service pools in total: {workers * hash_workers} hashing processes, "
+          f"{workers * render_workers} CAPTCHA render processes, {workers * pool_size} pre-rendered CAPTCHAs")
+
+
+def calibrate_password_hashing(service):
+    """Times PBKDF2 once in the master, so every worker hashes with the same count."""
+    if service != "user_service" or os.environ.get('PASSWORD_HASH_ITERATIONS'):
+        return
+    from password_hashing import calibrate_iterations, DEFAULT_TARGET_MS, DEFAULT_MIN_ITERATIONS
+    iterations = calibrate_iterations(
+        int(os.environ.get('PASSWORD_HASH_TARGET_MS', DEFAULT_TARGET_MS)),
+        int(os.environ.get('PASSWORD_HASH_MIN_ITERATIONS', DEFAULT_MIN_ITERATIONS))
+    )
+    os.environ['PASSWORD_HASH_ITERATIONS'] = str(iterations)
+
+
+def run_startup_hook(module_name):
+    """Runs the service's init_db() once, before any worker starts.
+
+    It runs in a short-lived interpreter so that the gunicorn master never
+    opens a database connection that the forked workers would inherit.
+    """
+    code = f"import {module_name}; {module_name}.init_db()"
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise SystemExit(f"Startup hook for {module_name} failed with exit code {result.returncode}")
+
+
+def reset_metrics_dir(service):
+    """Points the workers at a shared metrics directory, emptied on every start."""
+    base_dir = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'microshop-metrics')
+    metrics_dir = os.environ['METRICS_DIR'] = os.path.join(base_dir, service)
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('service', choices=list(SERVICES))
+    parser.add_argument('--worker-class', choices=WORKER_CLASSES, default=None)
+    parser.add_argument('--skip-init', action='store_true', help="Don't run init_db() before starting the workers")
+    args = parser.parse_args()
+
+    module_name, port, default_class = SERVICES[args.service]
+    worker_class = args.worker_class or os.environ.get('WEB_WORKER_CLASS') or default_class
+    if worker_class not in WORKER_CLASSES:
+        raise SystemExit(f"WEB_WORKER_CLASS must be one of {WORKER_CLASSES}")
+
+    options = gunicorn_options(args.service, port, worker_class)
+    # Before the startup hook, so that init_db() sees the same settings as the workers.
+    use_shared_stores(args.service, options['workers'])
+    size_process_pools(args.service, options['workers'])
+    calibrate_password_hashing(args.service)
+    if args.service == "payment_service" and options['workers'] > 1:
+        print("!!! WARNING: with several payment_service workers, PUT /payment/config only reaches "
+              "one of them and PAYMENT_SEED runs are not reproducible.")
+    if not args.skip_init:
+        run_startup_hook(module_name)
+    reset_metrics_dir(args.service)
+    print(f"Starting {args.service} on port {port} with {options['workers']} {worker_class} workers")
+    ServiceApplication(module_name, options).run()
@@ -6,21 +6,28 @@ import io
 import uuid
 import random
 import string
-import base64
+import hashlib
+import re
 from datetime import datetime, timedelta, timezone
-from functools import wraps
 
 # Third-party libraries
 import jwt
-import requests
-from captcha.image import ImageCaptcha
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, make_response # Make sure 'request' is imported
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from pymongo import MongoClient
-from werkzeug.security import generate_password_hash, check_password_hash
+
+from captcha_pool import CaptchaPool
+from captcha_store import MemoryCaptchaStore, MongoCaptchaStore
+from password_hashing import PasswordHasher, HashingBusy, calibrate_iterations, DEFAULT_TARGET_MS, DEFAULT_MIN_ITERATIONS
+from otp_outbox import OtpOutbox
+from common.cache import TTLCache
+from common.auth import admin_required, install_preflight_handler
+from common.mongo import create_client
+from common.metrics import metrics, install_metrics
+from common.tracing import install_tracing
+from common.json_provider import install_json_provider
 
 # --- 2. INITIALIZATION & CONFIGURATION ---
 load_dotenv()
@@ -37,6 +44,29 @@ CAPTCHA_ENABLED = os.environ.get('CAPTCHA_ENABLED', 'true').lower() == 'true'
 MAILGUN_API_KEY = os.environ.get('MAILGUN_API_KEY')
 MAILGUN_DOMAIN = os.environ.get('MAILGUN_DOMAIN')
 EMAIL_SENDER = os.environ.get('EMAIL_SENDER')
+MAILGUN_API_BASE = os.environ.get('MAILGUN_API_BASE', 'https://api.mailgun.net')
+OTP_SENDER_THREADS = int(os.environ.get('OTP_SENDER_THREADS', 2))
+OTP_BATCH_SIZE = int(os.environ.get('OTP_BATCH_SIZE', 50))
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))
+SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 60))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 100000))
+ADMIN_USERS_PAGE_SIZE = 50
+ADMIN_USERS_MAX_PAGE_SIZE = 200
+# memory:// is per process; serve.py switches to USER_DB_URI when it starts several workers.
+RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'sliding-window-counter')
+# Hashing and CAPTCHA pool settings are per process; serve.py divides them between its workers.
+CAPTCHA_POOL_SIZE = int(os.environ.get('CAPTCHA_POOL_SIZE', 200))
+CAPTCHA_POOL_WORKERS = int(os.environ.get('CAPTCHA_POOL_WORKERS', 1))
+CAPTCHA_STORE = os.environ.get('CAPTCHA_STORE', 'memory')
+CAPTCHA_TTL_SECONDS = int(os.environ.get('CAPTCHA_TTL_SECONDS', 300))
+CAPTCHA_STORE_MAX_SIZE = int(os.environ.get('CAPTCHA_STORE_MAX_SIZE', 10000))
+PASSWORD_HASH_TARGET_MS = int(os.environ.get('PASSWORD_HASH_TARGET_MS', DEFAULT_TARGET_MS))
+PASSWORD_HASH_MIN_ITERATIONS = int(os.environ.get('PASSWORD_HASH_MIN_ITERATIONS', DEFAULT_MIN_ITERATIONS))
+# Calibrated at import when unset; serve.py calibrates once and sets it for all workers.
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 0))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', PASSWORD_HASH_WORKERS * 4))
 
 if not all([MONGO_URI, SECRET_KEY]):
     raise RuntimeError("MONGO_URI and SECRET_KEY must be set.")
@@ -46,58 +76,91 @@ if OTP_ENABLED and not all([MAILGUN_API_KEY, MAILGUN_DOMAIN, EMAIL_SENDER]):
 # Flask App Initialization
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_preflight_handler(app)
+install_tracing(app)
+install_json_provider(app)
 
 # Extension Initialization
-limiter = Limiter(get_remote_address, app=app, default_limits=["200/day", "50/hour"], storage_uri="memory://")
-image_captcha = ImageCaptcha(width=280, height=90)
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    default_limits=["200/day", "50/hour"],
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
+    in_memory_fallback_enabled=RATELIMIT_STORAGE_URI != 'memory://'
+)
+# Scrapes would otherwise use up the default daily limit within hours.
+limiter.exempt(app.view_functions['prometheus_metrics'])
+captcha_pool = CaptchaPool(size=CAPTCHA_POOL_SIZE, workers=CAPTCHA_POOL_WORKERS)
+password_hasher = PasswordHasher(
+    iterations=PASSWORD_HASH_ITERATIONS or calibrate_iterations(PASSWORD_HASH_TARGET_MS, PASSWORD_HASH_MIN_ITERATIONS),
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING
+)
 
 # Database Connection
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.user_db
 users_collection = db.users
 refresh_tokens_collection = db.refresh_tokens
-captcha_store = {}
-
-# --- 3. SECURITY & DECORATORS ---
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        # --- THIS IS THE FIX ---
-        # Allow all OPTIONS requests to pass through for CORS preflight
-        if request.method == 'OPTIONS':
-            # --- UPDATED: Return a proper 200 OK for OPTIONS ---
-            return make_response(jsonify(message="CORS preflight OK"), 200)
-        # --- END OF FIX ---
-            
-        token = request.headers.get('Authorization', ' ').split(" ")[-1]
-        if not token: return jsonify({'message': 'Authentication Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            if data.get('role') != 'admin': return jsonify({'message': 'This action requires an admin account!'}), 403
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            return jsonify({'message': 'Token is invalid or expired!'}), 401
-        return f(*args, **kwargs)
-    return decorated
+
+# Short-lived per-process caches for the /refresh path. Role changes invalidate
+# the role locally; other workers converge within SESSION_CACHE_TTL. Whether a
+# refresh token is still live is always read from Mongo, so a logout or a newer
+# login is seen by every worker at once; only revocations, which never undo, are cached.
+role_cache = TTLCache(max_size=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)        # username -> role
+revoked_tokens = TTLCache(max_size=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)    # refresh token hash -> True
+metrics.register_cache('role', role_cache)
+metrics.register_cache('revoked_tokens', revoked_tokens)
+metrics.register_cache('captcha_pool', captcha_pool)
+# Use CAPTCHA_STORE=mongo whenever more than one worker process serves requests (serve.py does).
+if CAPTCHA_STORE == 'mongo':
+    captcha_store = MongoCaptchaStore(db.captchas, ttl=CAPTCHA_TTL_SECONDS)
+else:
+    captcha_store = MemoryCaptchaStore(ttl=CAPTCHA_TTL_SECONDS, max_size=CAPTCHA_STORE_MAX_SIZE)
+otp_outbox = OtpOutbox(
+    db.otp_outbox,
+    api_base=MAILGUN_API_BASE,
+    domain=MAILGUN_DOMAIN,
+    api_key=MAILGUN_API_KEY,
+    sender=EMAIL_SENDER,
+    senders=OTP_SENDER_THREADS,
+    batch_size=OTP_BATCH_SIZE,
+    max_attempts=OTP_MAX_ATTEMPTS,
+    otp_ttl=PRE_AUTH_TOKEN_EXPIRES
+)
+
+# --- 3. ERROR HANDLERS ---
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({"message": "The server is busy, please try again in a moment."})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # --- 4. HELPER FUNCTIONS ---
 def send_otp_email(recipient_email, otp):
-    if not recipient_email: return False
-    response = requests.post(
-        f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
-        auth=("api", MAILGUN_API_KEY),
-        data={"from": EMAIL_SENDER, "to": [recipient_email], "subject": "Your E-Commerce Verification Code", "text": f"Your one-time password is: {otp}\n\nThis code will expire in 5 minutes."})
-    if response.status_code == 200:
-        print(f"OTP email sent to {recipient_email} via Mailgun.")
-        return True
-    else:
-        print(f"Failed to send email via Mailgun: {response.text}")
+    """Queues the OTP email; delivery happens in the background outbox senders."""
+    try:
+        return otp_outbox.enqueue(recipient_email, otp)
+    except Exception as e:
+        print(f"Failed to queue OTP email: {e}")
         return False
 
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
 def _create_and_set_tokens(username, user_role):
-    refresh_tokens_collection.delete_many({'username': username})
     access_token = jwt.encode({'sub': username, 'role': user_role, 'type': 'access', 'exp': datetime.now(timezone.utc) + ACCESS_TOKEN_EXPIRES}, SECRET_KEY, algorithm="HS256")
     refresh_token = jwt.encode({'sub': username, 'type': 'refresh', 'exp': datetime.now(timezone.utc) + REFRESH_TOKEN_EXPIRES}, SECRET_KEY, algorithm="HS256")
-    refresh_tokens_collection.insert_one({'token': refresh_token, 'username': username})
+    token_hash = hash_token(refresh_token)
+    # One session per user: a new login replaces the previous refresh token in a single write.
+    refresh_tokens_collection.update_one(
+        {'username': username},
+        {'$set': {'token_hash': token_hash, 'expires_at': datetime.now(timezone.utc) + REFRESH_TOKEN_EXPIRES}},
+        upsert=True
+    )
+    role_cache.set(username, user_role)
     response = make_response(jsonify({'message': 'Login successful', 'access_token': access_token, 'username': username}))
     
     # --- FIX: Added secure=True for SameSite=None cookie ---
@@ -117,11 +180,14 @@ def _create_and_set_tokens(username, user_role):
 @app.route("/captcha/new", methods=['GET'])
 def new_captcha():
     captcha_id = str(uuid.uuid4())
-    captcha_text = "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    captcha_store[captcha_id] = captcha_text
-    img_bytes = image_captcha.generate(captcha_text).getvalue()
-    img_str = base64.b64encode(img_bytes).decode("utf-8")
-    return jsonify({'captcha_id': captcha_id, 'image': f'data:image/png;base64,{img_str}'})
+    captcha_text, image = captcha_pool.take()
+    captcha_store.put(captcha_id, captcha_text)
+    return jsonify({'captcha_id': captcha_id, 'image': image})
+
+@app.route("/admin/captcha/pool", methods=['GET', 'OPTIONS'])
+@admin_required
+def captcha_pool_metrics():
+    return jsonify(captcha_pool.metrics())
 
 @app.route("/register/start", methods=['POST'])
 @limiter.limit("10 per hour")
@@ -145,7 +211,7 @@ def register_start():
 
     # --- NEW: Conditionally validate CAPTCHA answer ---
     if CAPTCHA_ENABLED:
-        correct_answer = captcha_store.pop(captcha_id, None)
+        correct_answer = captcha_store.pop(captcha_id)
         if not correct_answer or captcha_answer.upper() != correct_answer.upper():
             return jsonify({"message": "Incorrect CAPTCHA"}), 401
     # --- END OF NEW ---
@@ -157,7 +223,7 @@ def register_start():
     pre_reg_token = jwt.encode({
         'scope': 'pre-reg-otp',
         'username': username,
-        'password': generate_password_hash(password, method='pbkdf2:sha256'),
+        'password': password_hasher.hash(password),
         'email': email,
         'role': role,
         'otp': otp,
@@ -206,13 +272,15 @@ def login():
 
     # --- NEW: Conditionally validate CAPTCHA answer ---
     if CAPTCHA_ENABLED:
-        correct_answer = captcha_store.pop(captcha_id, None)
+        correct_answer = captcha_store.pop(captcha_id)
         if not correct_answer or captcha_answer.upper() != correct_answer.upper():
             return jsonify({"message": "Incorrect CAPTCHA"}), 401
     # --- END OF NEW ---
 
     user = users_collection.find_one({"username": username})
-    if user and user.get('password') and isinstance(user.get('password'), str) and check_password_hash(user['password'], password):
+    if user and user.get('password') and isinstance(user.get('password'), str) and password_hasher.verify(user['password'], password):
+        if password_hasher.needs_rehash(user['password']):
+            users_collection.update_one({"username": username}, {"$set": {"password": password_hasher.hash(password)}})
         user_email = user.get("email")
         if OTP_ENABLED and user_email:
             otp = "".join(random.choices(string.digits, k=6))
@@ -250,26 +318,40 @@ def verify_otp():
 @app.route("/refresh", methods=['POST'])
 def refresh():
     token = request.cookies.get('refresh_token')
-    if not token or not refresh_tokens_collection.find_one({'token': token}):
+    if not token:
         return jsonify({'message': 'Refresh token is invalid or revoked!'}), 401
+    token_hash = hash_token(token)
     try:
         data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        username = data['sub']
-        user = users_collection.find_one({"username": username})
-        if not user: return jsonify({'message': 'User not found!'}), 401
-        user_role = user.get("role", "buyer")
-        new_access_token = jwt.encode({'sub': username, 'role': user_role, 'type': 'access', 'exp': datetime.now(timezone.utc) + ACCESS_TOKEN_EXPIRES}, SECRET_KEY, algorithm="HS256")
-        return jsonify({'access_token': new_access_token})
     except jwt.ExpiredSignatureError:
-        refresh_tokens_collection.delete_one({'token': token})
+        refresh_tokens_collection.delete_one({'token_hash': token_hash})
         return jsonify({'message': 'Refresh token has expired! Please log in again.'}), 401
     except jwt.InvalidTokenError:
         return jsonify({'message': 'Refresh token is invalid!'}), 401
 
+    username = data['sub']
+    if revoked_tokens.get(token_hash):
+        return jsonify({'message': 'Refresh token is invalid or revoked!'}), 401
+    if not refresh_tokens_collection.find_one({'token_hash': token_hash}, {'_id': 1}):
+        revoked_tokens.set(token_hash, True)
+        return jsonify({'message': 'Refresh token is invalid or revoked!'}), 401
+
+    user_role = role_cache.get(username)
+    if user_role is None:
+        user = users_collection.find_one({"username": username}, {'_id': 0, 'role': 1})
+        if not user: return jsonify({'message': 'User not found!'}), 401
+        user_role = user.get("role", "buyer")
+        role_cache.set(username, user_role)
+    new_access_token = jwt.encode({'sub': username, 'role': user_role, 'type': 'access', 'exp': datetime.now(timezone.utc) + ACCESS_TOKEN_EXPIRES}, SECRET_KEY, algorithm="HS256")
+    return jsonify({'access_token': new_access_token})
+
 @app.route("/logout", methods=['POST'])
 def logout():
     token = request.cookies.get('refresh_token')
-    if token: refresh_tokens_collection.delete_one({'token': token})
+    if token:
+        token_hash = hash_token(token)
+        refresh_tokens_collection.delete_one({'token_hash': token_hash})
+        revoked_tokens.set(token_hash, True)
     response = make_response(jsonify({'message': 'Successfully logged out.'}))
     response.set_cookie('refresh_token', '', expires=0)
     return response
@@ -278,8 +360,31 @@ def logout():
 @app.route("/admin/users", methods=['GET', 'OPTIONS'])
 @admin_required
 def get_all_users():
-    all_users = list(users_collection.find({}, {'_id': 0, 'password': 0}))
-    return jsonify(all_users)
+    limit = max(1, min(request.args.get('limit', ADMIN_USERS_PAGE_SIZE, type=int), ADMIN_USERS_MAX_PAGE_SIZE))
+    role = request.args.get('role')
+    search = request.args.get('q', '').strip()
+    after = request.args.get('after')
+
+    query = {}
+    if role:
+        if role not in ['buyer', 'seller', 'admin']: return jsonify({"message": "Invalid role"}), 400
+        query['role'] = role
+    if search:
+        # Anchored, case-sensitive prefixes can use the username and email indexes.
+        prefix = f"^{re.escape(search)}"
+        query['$or'] = [{'username': {'$regex': prefix}}, {'email': {'$regex': prefix}}]
+    if after:
+        query['username'] = {'$gt': after}
+
+    users = list(users_collection.find(query, {'_id': 0, 'username': 1, 'email': 1, 'role': 1}).sort('username', 1).limit(limit + 1))
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = users[-1]['username']
+    page = {'users': users, 'next_cursor': next_cursor}
+    if not role and not search:
+        page['total'] = users_collection.estimated_document_count()
+    return jsonify(page)
 
 # --- THIS IS THE FIX: Added 'OPTIONS' to the methods list ---
 @app.route("/admin/users/<string:username>/role", methods=['PUT', 'OPTIONS'])
@@ -290,14 +395,35 @@ def update_user_role(username):
         return jsonify({"message": "Valid role is required"}), 400
     result = users_collection.update_one({'username': username}, {'$set': {'role': new_role}})
     if result.matched_count == 0: return jsonify({"message": "User not found"}), 404
+    role_cache.pop(username)
     return jsonify({"message": f"User '{username}' role updated to '{new_role}'"}), 200
 
 # --- 6. APPLICATION RUNNER ---
-if __name__ == '__main__':
+
+def init_db():
     users_collection.create_index('username', unique=True)
     users_collection.create_index('email', unique=True, sparse=True)
-    refresh_tokens_collection.create_index('token', unique=True)
+    users_collection.create_index([('role', 1), ('username', 1)])
+    # Refresh tokens used to be stored in plain text under 'token'; those sessions are dropped.
+    if 'token_1' in refresh_tokens_collection.index_information():
+        refresh_tokens_collection.drop_index('token_1')
+    refresh_tokens_collection.delete_many({'token': {'$exists': True}})
+    refresh_tokens_collection.create_index('token_hash', unique=True)
+    refresh_tokens_collection.create_index('username', unique=True)
+    refresh_tokens_collection.create_index('expires_at', expireAfterSeconds=0)
+    captcha_store.ensure_indexes()
+    otp_outbox.ensure_indexes()
     print(f"OTP Verification is {'ENABLED' if OTP_ENABLED else 'DISABLED'}")
+    print(f"Password hashing uses {password_hasher.method} on {PASSWORD_HASH_WORKERS} worker processes")
     # --- NEW: Add log for CAPTCHA status ---
     print(f"CAPTCHA Verification is {'ENABLED' if CAPTCHA_ENABLED else 'DISABLED'}")
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+
+def start_background_tasks():
+    """Starts this process's OTP senders, so entries left pending by a restart go out."""
+    if OTP_ENABLED:
+        otp_outbox.start()
+
+if __name__ == '__main__':
+    init_db()
+    start_background_tasks()
+    app.run(host='0.0.0.0', port=5001, debug=True)
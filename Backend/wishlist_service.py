@@ -1,22 +1,28 @@
 # wishlist_service.py (Now loading secrets from .env file)
 
 import os
-from pymongo import MongoClient
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv # <-- 1. IMPORT THE LIBRARY
+from common.mongo import create_client
+from common.metrics import install_metrics
+from common.tracing import install_tracing
+from common.json_provider import install_json_provider
 
 load_dotenv() # <-- 2. LOAD THE .ENV FILE
 
 # 1. --- SETUP ---
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["null", "http://127.0.0.1:8080", "http://localhost:5173","http://192.168.1.*","http://172.31.30.*"])
+install_metrics(app)
+install_tracing(app)
+install_json_provider(app)
 
 # --- MONGODB ATLAS CONNECTION ---
 # 3. READ THE DATABASE URI FROM THE ENVIRONMENT
 MONGO_URI = os.environ.get('WISHLIST_DB_URI')
 
-client = MongoClient(MONGO_URI)
+client = create_client(MONGO_URI)
 db = client.wishlist_db
 wishlists_collection = db.wishlists
 
@@ -75,10 +81,11 @@ def remove_from_wishlist(user_id):
         print(f"Database error: {e}")
         return jsonify({"message": "Error updating wishlist"}), 500
 
-# 3. --- RUN THE APPLICATION ---
-if __name__ == '__main__':
+def init_db():
     wishlists_collection.create_index('user_id', unique=True)
     print("MongoDB wishlist 'user_id' index checked/created.")
-    
-    app.run(host='0.0.0.0', port=5006, debug=True)
 
+# 3. --- RUN THE APPLICATION ---
+if __name__ == '__main__':
+    init_db()
+    app.run(host='0.0.0.0', port=5006, debug=True)
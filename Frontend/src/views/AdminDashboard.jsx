@@ -97,10 +97,13 @@ export const AdminDashboard = () => {
     const { user, logout } = useAuth();
     const [view, setView] = useState('overview');
     const [users, setUsers] = useState([]);
+    const [userCount, setUserCount] = useState(0);
+    const [usersCursor, setUsersCursor] = useState(null);
     const [products, setProducts] = useState([]);
     const [allOrders, setAllOrders] = useState([]);
     const [inventory, setInventory] = useState([]);
     const [pendingReviews, setPendingReviews] = useState([]);
+    const [reviewsCursor, setReviewsCursor] = useState(null);
     
     const [stats, setStats] = useState({ totalRevenue: 0, totalOrders: 0 });
     const [revenueData, setRevenueData] = useState([]);
@@ -152,11 +155,13 @@ export const AdminDashboard = () => {
                 apiCall(`${API_URLS.USER}/admin/users`),
                 apiCall(`${API_URLS.PRODUCT}/products`),
                 apiCall(`${API_URLS.INVENTORY}/admin/inventory`),
-                apiCall(`${API_URLS.REVIEW}/admin/reviews/pending`),
+                apiCall(`${API_URLS.REVIEW}/admin/reviews/pending?limit=100`),
             ]);
 
             setAllOrders(ordersResult.data || []);
-            setUsers(usersResult.data || []);
+            setUsers(usersResult.data?.users || []);
+            setUserCount(usersResult.data?.total ?? 0);
+            setUsersCursor(usersResult.data?.next_cursor || null);
             setProducts(productsResult.data || []);
             
             const inventoryData = inventoryResult.data || [];
@@ -174,7 +179,8 @@ export const AdminDashboard = () => {
             }));
             
             setInventory(mergedInventory);
-            setPendingReviews(reviewsResult.data || []);
+            setPendingReviews(reviewsResult.data?.reviews || []);
+            setReviewsCursor(reviewsResult.data?.next_cursor || null);
 
         } catch (error) {
             showToast(error.message, 'error');
@@ -196,6 +202,28 @@ export const AdminDashboard = () => {
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, [user]);
 
+    const loadMoreUsers = async () => {
+        if (!usersCursor) return;
+        try {
+            const result = await apiCall(`${API_URLS.USER}/admin/users?after=${encodeURIComponent(usersCursor)}`);
+            setUsers(prev => [...prev, ...(result.data?.users || [])]);
+            setUsersCursor(result.data?.next_cursor || null);
+        } catch (error) {
+            showToast(error.message, 'error');
+        }
+    };
+
+    const loadMoreReviews = async () => {
+        if (!reviewsCursor) return;
+        try {
+            const result = await apiCall(`${API_URLS.REVIEW}/admin/reviews/pending?limit=100&after=${encodeURIComponent(reviewsCursor)}`);
+            setPendingReviews(prev => [...prev, ...(result.data?.reviews || [])]);
+            setReviewsCursor(result.data?.next_cursor || null);
+        } catch (error) {
+            showToast(error.message, 'error');
+        }
+    };
+
     const handleRoleChange = async (username, newRole) => {
         try {
             await apiCall(`${API_URLS.USER}/admin/users/${username}/role`, {
@@ -310,7 +338,7 @@ export const AdminDashboard = () => {
                                 <div className="grid grid-cols-1 gap-6 md:grid-cols-3">
                                     <StatCard title="Total Revenue" value={`$${stats.totalRevenue.toFixed(2)}`} />
                                     <StatCard title="Total Orders" value={stats.totalOrders} />
-                                    <StatCard title="Total Users" value={users.length} />
+                                    <StatCard title="Total Users" value={userCount} />
                                 </div>
                                 
                                 <div className="grid grid-cols-1 lg:grid-cols-2 gap-8">
@@ -370,7 +398,7 @@ export const AdminDashboard = () => {
 
                         {view === 'users' && (
                             <div className="p-6 bg-ocean-surface rounded-lg shadow-xl border border-ocean-accent/20">
-                                <h2 className="text-2xl font-bold mb-4 text-ocean-primary">All Users ({users.length})</h2>
+                                <h2 className="text-2xl font-bold mb-4 text-ocean-primary">All Users ({userCount})</h2>
                                 <div className="overflow-x-auto">
                                     <table className="w-full text-left">
                                         <thead><tr className="border-b border-ocean-accent/30 bg-ocean-light/50"><th className="p-3">Username</th><th className="p-3">Email</th><th className="p-3">Role</th><th className="p-3">Actions</th></tr></thead>
@@ -392,6 +420,11 @@ export const AdminDashboard = () => {
                                         </tbody>
                                     </table>
                                 </div>
+                                {usersCursor && (
+                                    <button onClick={loadMoreUsers} className="w-full px-4 py-2 mt-4 text-ocean-text bg-ocean-light/50 rounded-md hover:bg-ocean-accent/30 transition-colors">
+                                        Load more users
+                                    </button>
+                                )}
                             </div>
                         )}
 
@@ -463,6 +496,11 @@ export const AdminDashboard = () => {
                                         ))
                                     )}
                                 </div>
+                                {reviewsCursor && (
+                                    <button onClick={loadMoreReviews} className="w-full px-4 py-2 mt-4 text-ocean-text bg-ocean-light/50 rounded-md hover:bg-ocean-accent/30 transition-colors">
+                                        Load more reviews
+                                    </button>
+                                )}
                              </div>
                         )}
                     </div>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useAuth, apiCall } from '../Auth';
 
 const API_URLS = {
@@ -8,6 +8,18 @@ const API_URLS = {
     ORDER: 'http://172.31.30.53:5005',
     WISHLIST: 'http://172.31.30.53:5006',
     REVIEW: 'http://172.31.30.53:5008',
+    BFF: 'http://172.31.30.53:5009',
+};
+
+const PRODUCTS_PAGE_SIZE = 24;
+
+const BOOTSTRAP_ERRORS = {
+    products: 'Could not load products.',
+    cart: 'Could not load cart.',
+    wishlist: 'Wishlist service is unavailable.',
+    inventory: 'Could not load stock levels.',
+    ratings: 'Could not load ratings.',
+    product_details: 'Could not load some product details.',
 };
 
 const Toast = ({ message, type, onDismiss }) => {
@@ -209,6 +221,7 @@ const ReviewModal = ({ item, onClose, showToast }) => {
 
 const ViewReviewsModal = ({ productId, onClose }) => {
     const [reviews, setReviews] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState(null);
 
@@ -218,7 +231,8 @@ const ViewReviewsModal = ({ productId, onClose }) => {
             setIsLoading(true);
             try {
                 const result = await apiCall(`${API_URLS.REVIEW}/reviews/${productId}`);
-                setReviews(result.data);
+                setReviews(result.data.reviews || []);
+                setNextCursor(result.data.next_cursor || null);
             } catch (err) {
                 setError(err.message || "Failed to load reviews.");
             } finally {
@@ -228,6 +242,17 @@ const ViewReviewsModal = ({ productId, onClose }) => {
         fetchReviews();
     }, [productId]);
 
+    const loadMoreReviews = async () => {
+        if (!nextCursor) return;
+        try {
+            const result = await apiCall(`${API_URLS.REVIEW}/reviews/${productId}?before=${encodeURIComponent(nextCursor)}`);
+            setReviews(prev => [...prev, ...(result.data.reviews || [])]);
+            setNextCursor(result.data.next_cursor || null);
+        } catch (err) {
+            setError(err.message || "Failed to load reviews.");
+        }
+    };
+
     return (
         <div className="fixed inset-0 z-50 flex items-center justify-center bg-black bg-opacity-50">
             <div className="w-full max-w-lg p-6 bg-ocean-surface rounded-lg shadow-xl max-h-[80vh] overflow-y-auto">
@@ -249,6 +274,11 @@ const ViewReviewsModal = ({ productId, onClose }) => {
                                 <p className="mt-2 text-ocean-text">{review.comment}</p>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button type="button" onClick={loadMoreReviews} className="w-full px-4 py-2 mt-4 text-ocean-text bg-ocean-light/50 rounded-md hover:bg-ocean-accent/30 transition-colors">
+                                Load more reviews
+                            </button>
+                        )}
                     </div>
                 )}
                 <button type="button" onClick={onClose} className="w-full px-4 py-2 mt-6 text-ocean-text bg-ocean-light/50 rounded-md hover:bg-ocean-accent/30 transition-colors">
@@ -272,6 +302,11 @@ export const BuyerDashboard = () => {
     const [currentView, setCurrentView] = useState('shop');
     const [productDetails, setProductDetails] = useState({});
     const [toast, setToast] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
+    const hasSearched = useRef(false);
+    // Reused until the checkout gets an answer, so a retry after a dropped connection can't charge twice.
+    const checkoutKey = useRef(null);
     const [searchQuery, setSearchQuery] = useState('');
     const debouncedSearchQuery = useDebounce(searchQuery, 500);
 
@@ -297,36 +332,35 @@ export const BuyerDashboard = () => {
         }
     }, [productDetails]);
 
+    // One round trip to the BFF instead of a request per service; sections it
+    // could not load come back empty and are named in `errors`.
+    const loadBootstrap = useCallback(async (after) => {
+        const params = new URLSearchParams({ limit: PRODUCTS_PAGE_SIZE });
+        if (after) params.set('after', after);
+        const result = await apiCall(`${API_URLS.BFF}/buyer/bootstrap?${params}`);
+        const data = result.data || {};
+        (data.errors || []).forEach(section => showToast(BOOTSTRAP_ERRORS[section] || `Could not load ${section}.`, 'error'));
+        return data;
+    }, []);
+
     const fetchAllData = useCallback(async () => {
         try {
-            const results = await Promise.allSettled([
-                apiCall(`${API_URLS.PRODUCT}/products`),
-                apiCall(`${API_URLS.CART}/cart/${user.name}`),
-                apiCall(`${API_URLS.WISHLIST}/wishlist/${user.name}`),
-                apiCall(`${API_URLS.INVENTORY}/inventory`),
-            ]);
-            
-            const productsData = results[0].status === 'fulfilled' ? results[0].value.data : [];
-            const cartData = results[1].status === 'fulfilled' ? results[1].value.data : [];
-            const wishlistData = results[2].status === 'fulfilled' ? results[2].value.data : [];
-            const inventoryData = results[3].status === 'fulfilled' ? results[3].value.data : [];
-            
-            if (results[0].status === 'rejected') showToast('Could not load products.', 'error');
-            if (results[1].status === 'rejected') showToast('Could not load cart.', 'error');
-            if (results[2].status === 'rejected') showToast('Wishlist service is unavailable.', 'error');
-            if (results[3].status === 'rejected') showToast('Could not load stock levels.', 'error');
+            const data = await loadBootstrap();
+            const productsData = data.products || [];
 
             setProducts(productsData);
-            setCart(cartData);
-            setWishlist(wishlistData);
-            
-            const inventoryMap = inventoryData.reduce((acc, item) => {
+            setNextCursor(data.next_cursor || null);
+            setCart(data.cart || []);
+            setWishlist(data.wishlist || []);
+            setRatings(data.ratings || {});
+
+            const inventoryMap = (data.inventory || []).reduce((acc, item) => {
                 acc[item.product_id] = item.quantity;
                 return acc;
             }, {});
             setInventory(inventoryMap);
 
-            const initialDetails = productsData.reduce((acc, p) => {
+            const initialDetails = [...productsData, ...(data.product_details || [])].reduce((acc, p) => {
                 acc[p.id] = p;
                 return acc;
             }, {});
@@ -335,19 +369,49 @@ export const BuyerDashboard = () => {
         } catch (error) {
             showToast(error.message, 'error');
         }
-    }, [user.name]);
+    }, [loadBootstrap]);
+
+    const handleLoadMore = async () => {
+        if (!nextCursor) return;
+        setIsLoadingMore(true);
+        try {
+            const data = await loadBootstrap(nextCursor);
+            const pageData = data.products || [];
+            setProducts(prev => [...prev, ...pageData]);
+            setNextCursor(data.next_cursor || null);
+            setRatings(prev => ({ ...prev, ...(data.ratings || {}) }));
+            setInventory(prev => (data.inventory || []).reduce((acc, item) => {
+                acc[item.product_id] = item.quantity;
+                return acc;
+            }, { ...prev }));
+            setProductDetails(prev => [...pageData, ...(data.product_details || [])].reduce((acc, p) => {
+                acc[p.id] = p;
+                return acc;
+            }, { ...prev }));
+        } catch (error) {
+            showToast(error.message, 'error');
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
     
     useEffect(() => {
         const searchProducts = async () => {
             if (debouncedSearchQuery) {
+                hasSearched.current = true;
                 try {
                     const result = await apiCall(`${API_URLS.PRODUCT}/products/search?q=${debouncedSearchQuery}`);
                     setProducts(result.data);
                 } catch (error) {
                     showToast(error.message, 'error');
                 }
-            } else if (searchQuery === '') {
-                apiCall(`${API_URLS.PRODUCT}/products`).then(result => setProducts(result.data)).catch(err => showToast(err.message, 'error'));
+            } else if (searchQuery === '' && hasSearched.current) {
+                // Back to the first page once a search is cleared; the initial load comes from the BFF.
+                hasSearched.current = false;
+                apiCall(`${API_URLS.PRODUCT}/products?limit=${PRODUCTS_PAGE_SIZE}`).then(result => {
+                    setProducts(result.data.products);
+                    setNextCursor(result.data.next_cursor || null);
+                }).catch(err => showToast(err.message, 'error'));
             }
         };
         searchProducts();
@@ -358,25 +422,20 @@ export const BuyerDashboard = () => {
     }, [user, fetchAllData]);
     
     useEffect(() => {
-        if (products.length > 0) {
-            const fetchAllRatings = async () => {
-                const ratingPromises = products.map(p => 
-                    apiCall(`${API_URLS.REVIEW}/reviews/average/${p.id}`)
-                );
-                const results = await Promise.allSettled(ratingPromises);
-                const ratingsMap = results.reduce((acc, result) => {
-                    if (result.status === 'fulfilled' && result.value.data) {
-                        const data = result.value.data;
-                        acc[data.product_id] = {
-                            averageRating: data.averageRating,
-                            reviewCount: data.reviewCount
-                        };
-                    }
-                    return acc;
-                }, {});
-                setRatings(ratingsMap);
+        // The bootstrap call already brings ratings for its pages; only search results need fetching.
+        const missingIds = products.map(p => p.id).filter(id => !ratings[id]);
+        if (missingIds.length > 0) {
+            const fetchMissingRatings = async () => {
+                try {
+                    const result = await apiCall(`${API_URLS.REVIEW}/reviews/averages`, {
+                        method: 'POST', body: JSON.stringify({ product_ids: missingIds })
+                    });
+                    setRatings(prev => ({ ...prev, ...(result.data || {}) }));
+                } catch (error) {
+                    // Cards simply show no rating.
+                }
             };
-            fetchAllRatings();
+            fetchMissingRatings();
         }
     }, [products]);
 
@@ -434,7 +493,11 @@ export const BuyerDashboard = () => {
         setPaymentError(null);
 
         try {
-            const result = await apiCall(`${API_URLS.ORDER}/orders/create`, { method: 'POST' });
+            if (!checkoutKey.current) checkoutKey.current = crypto.randomUUID();
+            const result = await apiCall(`${API_URLS.ORDER}/orders/create`, {
+                method: 'POST', headers: { 'Idempotency-Key': checkoutKey.current }
+            });
+            checkoutKey.current = null;
             
             showToast(`Order placed! Order ID: ${result.data.order_id}`);
             setCart([]);
@@ -442,6 +505,10 @@ export const BuyerDashboard = () => {
             setCurrentView('shop');
 
         } catch(error) {
+            // fetch() throws a TypeError when no response arrived; the order may still have gone through.
+            if (!(error instanceof TypeError) && !error.message.includes("still being processed")) {
+                checkoutKey.current = null;
+            }
             let friendlyError = "An unknown payment error occurred. Please try again.";
             
             if (error.message.includes("insufficient_funds")) {
@@ -514,6 +581,13 @@ export const BuyerDashboard = () => {
                                 onViewReviews={() => setViewingReviewsFor(p.id)}
                             />
                         ))}</div>
+                        {nextCursor && !searchQuery && (
+                            <div className="flex justify-center mt-8">
+                                <button onClick={handleLoadMore} disabled={isLoadingMore} className="px-6 py-2 font-bold text-white bg-ocean-secondary rounded-md hover:bg-ocean-secondary-hover disabled:bg-gray-400 transition-colors">
+                                    {isLoadingMore ? 'Loading...' : 'Load more products'}
+                                </button>
+                            </div>
+                        )}
                     </div>
                  )}
                  {currentView === 'cart' && (
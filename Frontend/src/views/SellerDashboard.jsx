@@ -138,6 +138,7 @@ export const SellerDashboard = () => {
     const [myProducts, setMyProducts] = useState([]);
     const [stats, setStats] = useState({ totalRevenue: 0, totalSales: 0 });
     const [reviews, setReviews] = useState([]);
+    const [reviewsCursor, setReviewsCursor] = useState(null);
     const [isLoading, setIsLoading] = useState(true);
     const [toast, setToast] = useState(null);
     const [currentView, setCurrentView] = useState('products');
@@ -164,11 +165,12 @@ export const SellerDashboard = () => {
 
             const sellerProductIds = sellerProducts.map(p => p.id);
             if (sellerProductIds.length > 0) {
-                const reviewsResult = await apiCall(`${API_URLS.REVIEW}/seller/reviews`, {
+                const reviewsResult = await apiCall(`${API_URLS.REVIEW}/seller/reviews?limit=100`, {
                     method: 'POST',
                     body: JSON.stringify({ product_ids: sellerProductIds })
                 });
-                setReviews(reviewsResult.data || []);
+                setReviews(reviewsResult.data?.reviews || []);
+                setReviewsCursor(reviewsResult.data?.next_cursor || null);
             }
         } catch (error) {
             showToast(error.message, 'error');
@@ -181,6 +183,20 @@ export const SellerDashboard = () => {
         fetchAllData();
     }, [fetchAllData]);
 
+    const loadMoreReviews = async () => {
+        if (!reviewsCursor) return;
+        try {
+            const result = await apiCall(`${API_URLS.REVIEW}/seller/reviews?limit=100&before=${encodeURIComponent(reviewsCursor)}`, {
+                method: 'POST',
+                body: JSON.stringify({ product_ids: myProducts.map(p => p.id) })
+            });
+            setReviews(prev => [...prev, ...(result.data?.reviews || [])]);
+            setReviewsCursor(result.data?.next_cursor || null);
+        } catch (error) {
+            showToast(error.message, 'error');
+        }
+    };
+
     const handleAddProduct = async (e) => {
         e.preventDefault();
         try {
@@ -317,6 +333,11 @@ export const SellerDashboard = () => {
                                      ))
                                     }
                                 </div>
+                                {reviewsCursor && (
+                                    <button onClick={loadMoreReviews} className="w-full px-4 py-2 mt-4 text-ocean-text bg-ocean-light/50 rounded-md hover:bg-ocean-accent/30 transition-colors">
+                                        Load more reviews
+                                    </button>
+                                )}
                             </div>
                         )}
                     </div>